@@ -0,0 +1,110 @@
+# asyncio entry points for services that format many documents at once.
+#
+#   async with AsyncFormatter(max_concurrency=32, timeout=5) as formatter:
+#       result = await formatter.format("html", text)
+#       if result.ok:
+#           ... result.text ...
+#       else:
+#           ... result.error.kind, result.error.message, result.error.line ...
+#
+# The formatting runs on an executor (by default a process pool created on
+# first use; pass a ThreadPoolExecutor for cheap small inputs), so the event
+# loop never blocks on it. At most max_concurrency documents are in the
+# executor at a time and further callers wait for a slot, which keeps the
+# executor queue and its memory bounded however many requests arrive. A slot
+# is only given back when the work has really finished, also after a timeout.
+#
+# Nothing here raises for bad input or shows a dialog: every call returns a
+# FormatResult, with a FormatError whose kind is "syntax", "timeout" or
+# "error".
+
+import asyncio
+from collections import namedtuple
+
+import registry
+
+FormatResult = namedtuple("FormatResult", ["ok", "text", "error"])
+FormatError = namedtuple("FormatError", ["kind", "message", "line", "column"])
+
+
+def _error(e):
+    if isinstance(e, SyntaxError):
+        return FormatError("syntax", e.msg, e.lineno, e.offset)
+    return FormatError("error", f"{type(e).__name__}: {e}", None, None)
+
+
+def _release(loop, slots):
+    # The loop may be gone by the time abandoned work finishes
+    try:
+        loop.call_soon_threadsafe(slots.release)
+    except RuntimeError:
+        pass
+
+
+class AsyncFormatter:
+    def __init__(self, executor=None, max_concurrency=64, timeout=10.0):
+        self.executor = executor
+        self._owns_executor = executor is None
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._slots = None
+
+    def _get_executor(self):
+        if self.executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(initializer=registry.warm)
+        return self.executor
+
+    async def format(self, language, text, indent_size=4, timeout=None):
+        # timeout (default self.timeout; no limit if that is None) covers the wait
+        # for a slot as well as the formatting
+        if language not in registry.names():
+            return FormatResult(False, None, FormatError("error", f"unknown language {language!r}", None, None))
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            text = await asyncio.wait_for(self._run(language, text, indent_size), timeout)
+        except asyncio.TimeoutError:
+            return FormatResult(False, None, FormatError("timeout", f"not formatted within {timeout} seconds",
+                                                         None, None))
+        except Exception as e:
+            return FormatResult(False, None, _error(e))
+        return FormatResult(True, text, None)
+
+    async def format_html(self, text, indent_size=4, timeout=None):
+        return await self.format("html", text, indent_size, timeout)
+
+    async def format_python(self, text, indent_size=4, timeout=None):
+        return await self.format("python", text, indent_size, timeout)
+
+    async def format_many(self, documents, indent_size=4, timeout=None):
+        # documents is an iterable of (language, text); results come back in
+        # the same order
+        return await asyncio.gather(*(self.format(language, text, indent_size, timeout)
+                                      for language, text in documents))
+
+    async def _run(self, language, text, indent_size):
+        loop = asyncio.get_running_loop()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        slots = self._slots
+        await slots.acquire()
+        try:
+            future = self._get_executor().submit(registry.format_text, language, text, indent_size)
+        except BaseException:
+            slots.release()
+            raise
+        # Released from the executor's side, so a request that timed out
+        # keeps its slot until its worker is actually free again
+        future.add_done_callback(lambda _: _release(loop, slots))
+        return await asyncio.wrap_future(future)
+
+    def close(self):
+        if self._owns_executor and self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
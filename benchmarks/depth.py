@@ -0,0 +1,74 @@
+# Traversal benchmark at nesting depths of 10, 1k and 100k.
+#
+# Python trees are built directly as AST nodes, since ast.parse itself
+# cannot take such deep input. Nested statements and HTML are formatted with
+# indent_size=0 so the output stays linear in depth and the numbers measure
+# the traversal rather than writing indentation.
+#
+#   python -m benchmarks.depth [--depths 10 1000 100000]
+
+import argparse
+import ast
+import time
+
+from for_html import HTMLFormatter, HTMLTreeBuilder
+from for_python import CodeFormatter
+
+
+def binop_chain(depth):
+    node = ast.Name(id="x", ctx=ast.Load())
+    for _ in range(depth):
+        node = ast.BinOp(left=node, op=ast.Add(), right=ast.Constant(value=1))
+    return node
+
+
+def nested_ifs(depth):
+    node = ast.Pass()
+    for _ in range(depth):
+        node = ast.If(test=ast.Name(id="x", ctx=ast.Load()), body=[node], orelse=[])
+    return node
+
+
+def nested_divs(depth):
+    return "<div>" * depth + "text" + "</div>" * depth
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--depths", type=int, nargs="+", default=[10, 1000, 100000])
+    args = parser.parse_args()
+
+    code_formatter = CodeFormatter()
+    flat_code_formatter = CodeFormatter()
+    flat_code_formatter.indent_size = 0
+    html_formatter = HTMLFormatter(indent_size=0)
+
+    print(f"{'case':<22} {'depth':>8} {'seconds':>10} {'us/level':>10}")
+    for depth in args.depths:
+        expression = binop_chain(depth)
+        statement = nested_ifs(depth)
+        document = nested_divs(depth)
+        builder = HTMLTreeBuilder()
+        builder.feed(document)
+        builder.close()
+        tree = builder.get_tree()
+        cases = [
+            ("python expression", lambda: code_formatter.get_node_name(expression)),
+            ("python statements", lambda: flat_code_formatter.format_node(statement)),
+            ("html format", lambda: html_formatter.format_html(document)),
+            ("python visualize", lambda: code_formatter.visualize_tree(expression).dot()),
+            ("html visualize", lambda: html_formatter.visualize_html_tree(tree).dot()),
+        ]
+        for name, func in cases:
+            seconds = timed(func)
+            print(f"{name:<22} {depth:>8} {seconds:>10.4f} {seconds * 1e6 / depth:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
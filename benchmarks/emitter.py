@@ -0,0 +1,50 @@
+# Output scaling benchmark for the formatters' output sink.
+#
+# Formats generated documents that double in size and prints the time per KB
+# of output. The HTML blocks are nested 200 levels deep, which is where
+# repeated string concatenation used to copy each subtree once per ancestor.
+# With the buffered emitter the last column should stay roughly flat.
+#
+#   python -m benchmarks.emitter [--steps 6]
+
+import argparse
+import time
+
+from benchmarks.inputs import nested_html, python_module
+from for_html import HTMLFormatter
+from for_python import CodeFormatter
+
+
+def measure(func, text, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(output)
+
+
+def report(name, func, inputs):
+    print(f"{name}")
+    print(f"{'input':>10} {'output KB':>10} {'seconds':>10} {'us/KB':>10}")
+    for label, text in inputs:
+        seconds, size = measure(func, text)
+        print(f"{label:>10} {size / 1024:>10.1f} {seconds:>10.4f} {seconds * 1e6 / (size / 1024):>10.1f}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, default=6)
+    args = parser.parse_args()
+
+    sizes = [2 ** i * 10 for i in range(args.steps)]
+    report("HTMLFormatter.format_html (blocks)", HTMLFormatter().format_html,
+           [(str(n), nested_html(n)) for n in sizes])
+    report("CodeFormatter.format_code (functions)", CodeFormatter().format_code,
+           [(str(n), python_module(n)) for n in sizes])
+
+
+if __name__ == "__main__":
+    main()
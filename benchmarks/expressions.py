@@ -0,0 +1,58 @@
+# Micro-benchmark of CodeFormatter.get_node_name per expression node type.
+#
+# Each sample expression is parsed once; the benchmark then times printing it
+# and reports the cost per call. Types without a printer show up as empty
+# output.
+#
+#   python -m benchmarks.expressions [--number 20000]
+
+import argparse
+import ast
+import timeit
+
+from for_python import CodeFormatter
+
+SAMPLES = {
+    "Name": "x",
+    "Constant": "42",
+    "Call": "f(a, *b, k=1, **kw)",
+    "Attribute": "a.b.c",
+    "Subscript": "a[1:2]",
+    "BinOp": "a + b * c",
+    "UnaryOp": "not a",
+    "BoolOp": "a and b or c",
+    "Compare": "a < b <= c",
+    "IfExp": "a if b else c",
+    "NamedExpr": "(n := 10)",
+    "Lambda": "lambda x, y: x + y",
+    "Await": "await x",
+    "Yield": "(yield x)",
+    "YieldFrom": "(yield from x)",
+    "JoinedStr": "f'{a!r:>10} and {b}'",
+    "Starred": "[*a]",
+    "List": "[1, 2, 3]",
+    "Tuple": "(1, 2, 3)",
+    "Set": "{1, 2, 3}",
+    "Dict": "{'a': 1, **b}",
+    "ListComp": "[i for i in x if i]",
+    "GeneratorExp": "(i for i in x)",
+    "SetComp": "{i for i in x}",
+    "DictComp": "{k: v for k, v in x}",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    formatter = CodeFormatter()
+    print(f"{'node type':<14} {'ns/call':>10}  output")
+    for name, source in SAMPLES.items():
+        node = ast.parse(source, mode="eval").body
+        seconds = min(timeit.repeat(lambda: formatter.get_node_name(node), number=args.number, repeat=3))
+        print(f"{name:<14} {seconds / args.number * 1e9:>10.0f}  {formatter.get_node_name(node)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,790 @@
+# Fuzzing and throughput harness for the formatters.
+#
+# Generates Python and HTML inputs by mutating the PYTHON.txt/HTML.txt cases
+# (and any files given with --corpus), formats each one on a process pool and
+# checks the result:
+#
+#   python   the input and the output parse to the same ast.dump(), and
+#            formatting the output again changes nothing
+#   html     HTMLTreeBuilder builds equivalent trees (dom.diff_trees) from
+#            the input and the output, and formatting is idempotent
+#
+# Inputs that do not parse must be rejected with a SyntaxError; any other
+# exception is a crash. The first formatting of every input is timed, and the
+# report gives latency percentiles and throughput per operation next to the
+# failures, grouped by what went wrong. One input of each group that is
+# printed is shrunk to a small reproducer.
+#
+#   python -m benchmarks.fuzz [--count 5000] [--seed 1] [-j 4]
+#   python -m benchmarks.fuzz --only html.format --corpus ~/pages
+#   python -m benchmarks.fuzz --save fuzz.json
+#   python -m benchmarks.fuzz --compare fuzz.json [--tolerance 0.25]
+#
+# The exit status is 1 when there are failures or, with --compare, when there
+# are failures the baseline did not have or the latency percentiles grew by
+# more than the tolerance. Runs with the same --seed and --count generate the
+# same inputs.
+
+import argparse
+import ast
+import copy
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+import warnings
+
+import dom
+import for_html
+import registry
+from benchmarks import inputs
+from benchmarks.harness import html_format, python_format, python_tokens
+
+OPERATIONS = {
+    "python.format": ("python", python_format),
+    "python.tokens": ("python", python_tokens),
+    "html.format": ("html", html_format),
+}
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+# Python generation
+
+NAMES = ["x", "y", "value", "items", "self", "cls", "_", "f", "data", "i"]
+CONSTANTS = [0, 1, 42, 10 ** 20, 3.14, 1e100, 0.5j, "text", "", "it's", 'say "hi"', "tab\there",
+             "line\nbreak", "back\\slash", "café", b"bytes", None, True, False, Ellipsis]
+BINARY = [ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.LShift, ast.RShift,
+          ast.BitOr, ast.BitXor, ast.BitAnd, ast.MatMult]
+UNARY = [ast.Not, ast.USub, ast.UAdd, ast.Invert]
+COMPARE = [ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Is, ast.IsNot, ast.In, ast.NotIn]
+
+
+def _node(cls, **fields):
+    # Fields that differ between Python versions (type_params, ...) are
+    # filled in empty
+    for name in cls._fields:
+        fields.setdefault(name, [] if name == "type_params" else None)
+    return cls(**fields)
+
+
+def _leaf(rng):
+    if rng.random() < 0.5:
+        return ast.Name(rng.choice(NAMES), ast.Load())
+    return ast.Constant(rng.choice(CONSTANTS))
+
+
+def _arguments(rng, depth):
+    names = rng.sample(NAMES[:6], rng.randint(0, 4))
+    split = rng.randint(0, len(names))
+    args = [ast.arg(name) for name in names]
+    if rng.random() < 0.3:
+        for arg in args:
+            arg.annotation = _leaf(rng)
+    defaults = [_expression(rng, depth + 1) for _ in range(rng.randint(0, len(args) - split))]
+    kwonly = [ast.arg(name) for name in rng.sample(["k", "key", "flag"], rng.randint(0, 2))]
+    posonly = rng.random() < 0.3
+    return _node(ast.arguments,
+                 posonlyargs=args[:split] if posonly else [],
+                 args=args[split:] if posonly else args,
+                 vararg=ast.arg("args") if rng.random() < 0.3 else None,
+                 kwonlyargs=kwonly,
+                 kw_defaults=[_expression(rng, depth + 1) if rng.random() < 0.5 else None for _ in kwonly],
+                 kwarg=ast.arg("kwargs") if rng.random() < 0.3 else None,
+                 defaults=defaults)
+
+
+def _comprehensions(rng, depth):
+    return [ast.comprehension(ast.Name(rng.choice(NAMES), ast.Store()), _expression(rng, depth + 1),
+                              [_expression(rng, depth + 1) for _ in range(rng.randint(0, 1))], 0)
+            for _ in range(rng.randint(1, 2))]
+
+
+def _slice(rng, depth):
+    parts = [_expression(rng, depth + 1) if rng.random() < 0.5 else None for _ in range(3)]
+    return ast.Slice(*parts)
+
+
+def _expression(rng, depth=0):
+    # A random expression a few levels deep; ast.unparse adds whatever
+    # parentheses it needs
+    if depth >= 3 or rng.random() < 0.25:
+        return _leaf(rng)
+    e = lambda: _expression(rng, depth + 1)
+    kind = rng.randrange(20)
+    if kind == 0:
+        return ast.BinOp(e(), rng.choice(BINARY)(), e())
+    if kind == 1:
+        return ast.UnaryOp(rng.choice(UNARY)(), e())
+    if kind == 2:
+        return ast.BoolOp(rng.choice([ast.And, ast.Or])(), [e() for _ in range(rng.randint(2, 3))])
+    if kind == 3:
+        count = rng.randint(1, 3)
+        return ast.Compare(e(), [rng.choice(COMPARE)() for _ in range(count)], [e() for _ in range(count)])
+    if kind == 4:
+        args = [e() for _ in range(rng.randint(0, 3))]
+        if rng.random() < 0.2:
+            args.append(ast.Starred(e(), ast.Load()))
+        keywords = [ast.keyword(name, e()) for name in rng.sample(["key", "sep", "end"], rng.randint(0, 2))]
+        if rng.random() < 0.2:
+            keywords.append(ast.keyword(None, e()))
+        return ast.Call(e(), args, keywords)
+    if kind == 5:
+        return ast.Attribute(e(), rng.choice(["real", "append", "x", "__class__"]), ast.Load())
+    if kind == 6:
+        choice = rng.random()
+        if choice < 0.4:
+            index = _slice(rng, depth)
+        elif choice < 0.6:
+            index = ast.Tuple([_slice(rng, depth) if rng.random() < 0.5 else e() for _ in range(2)], ast.Load())
+        else:
+            index = e()
+        return ast.Subscript(e(), index, ast.Load())
+    if kind == 7:
+        # Zero, one and more elements, the one-element tuple being the
+        # interesting one
+        return ast.Tuple([e() for _ in range(rng.choice([0, 1, 1, 2, 3]))], ast.Load())
+    if kind == 8:
+        return ast.List([e() for _ in range(rng.randint(0, 3))], ast.Load())
+    if kind == 9:
+        return ast.Set([e() for _ in range(rng.randint(1, 3))])
+    if kind == 10:
+        keys = [e() if rng.random() < 0.8 else None for _ in range(rng.randint(0, 3))]
+        return ast.Dict(keys, [e() for _ in keys])
+    if kind == 11:
+        return ast.IfExp(e(), e(), e())
+    if kind == 12:
+        return ast.Lambda(_arguments(rng, depth), e())
+    if kind == 13:
+        return ast.ListComp(e(), _comprehensions(rng, depth))
+    if kind == 14:
+        return ast.SetComp(e(), _comprehensions(rng, depth))
+    if kind == 15:
+        return ast.DictComp(e(), e(), _comprehensions(rng, depth))
+    if kind == 16:
+        return ast.GeneratorExp(e(), _comprehensions(rng, depth))
+    if kind == 17:
+        spec = ast.JoinedStr([ast.Constant(rng.choice([">10", ".2f", "x"]))]) if rng.random() < 0.3 else None
+        value = ast.FormattedValue(e(), rng.choice([-1, -1, ord("r"), ord("s"), ord("a")]), spec)
+        return ast.JoinedStr([ast.Constant(rng.choice(["a ", "", "{x} "])), value])
+    if kind == 18:
+        return ast.NamedExpr(ast.Name(rng.choice(NAMES), ast.Store()), e())
+    return ast.Constant(rng.choice(CONSTANTS))
+
+
+def _target(rng):
+    kind = rng.randrange(5)
+    if kind == 0:
+        return ast.Tuple([ast.Name(name, ast.Store()) for name in rng.sample(NAMES, rng.randint(1, 3))],
+                         ast.Store())
+    if kind == 1:
+        return ast.Subscript(_leaf(rng), _expression(rng, 2), ast.Store())
+    if kind == 2:
+        return ast.Attribute(ast.Name(rng.choice(NAMES), ast.Load()), "attr", ast.Store())
+    return ast.Name(rng.choice(NAMES), ast.Store())
+
+
+def _body(rng, depth):
+    if depth >= 2:
+        return [ast.Pass()]
+    return [_statement(rng, depth + 1) for _ in range(rng.randint(1, 2))]
+
+
+def _statement(rng, depth=0):
+    e = lambda: _expression(rng, 1)
+    kind = rng.randrange(22)
+    if kind == 0:
+        return _node(ast.Assign, targets=[_target(rng) for _ in range(rng.randint(1, 2))], value=e())
+    if kind == 1:
+        return ast.AugAssign(ast.Name(rng.choice(NAMES), ast.Store()), rng.choice(BINARY)(), e())
+    if kind == 2:
+        return ast.AnnAssign(ast.Name(rng.choice(NAMES), ast.Store()), _leaf(rng),
+                             e() if rng.random() < 0.7 else None, 1)
+    if kind == 3:
+        return ast.Return(e() if rng.random() < 0.7 else None)
+    if kind == 4:
+        return ast.Delete([_target(rng)])
+    if kind == 5:
+        return ast.Assert(e(), e() if rng.random() < 0.5 else None)
+    if kind == 6:
+        return ast.Raise(e() if rng.random() < 0.8 else None, None) if rng.random() < 0.7 else ast.Raise(e(), e())
+    if kind == 7:
+        return ast.Import([ast.alias(rng.choice(["os", "os.path", "json"]), rng.choice([None, "m"]))])
+    if kind == 8:
+        module = rng.choice(["os", None, "pkg.mod"])
+        level = rng.choice([0, 0, 1, 2]) if module else rng.choice([1, 2])
+        return ast.ImportFrom(module, [ast.alias(name, rng.choice([None, "alias"]))
+                                       for name in rng.sample(NAMES[:5], rng.randint(1, 3))], level)
+    if kind == 9:
+        return rng.choice([ast.Global, ast.Nonlocal])(rng.sample(NAMES[:5], rng.randint(1, 2)))
+    if kind == 10:
+        return rng.choice([ast.Pass, ast.Break, ast.Continue])()
+    if kind == 11:
+        orelse = [] if rng.random() < 0.5 else [_statement(rng, 2) if rng.random() < 0.5 else
+                                                  ast.If(e(), _body(rng, depth), [])]
+        return ast.If(e(), _body(rng, depth), orelse)
+    if kind == 12:
+        orelse = _body(rng, depth) if rng.random() < 0.2 else []
+        return _node(ast.For, target=_target(rng), iter=e(), body=_body(rng, depth), orelse=orelse)
+    if kind == 13:
+        return ast.While(e(), _body(rng, depth), _body(rng, depth) if rng.random() < 0.2 else [])
+    if kind == 14:
+        items = [ast.withitem(e(), ast.Name(rng.choice(NAMES), ast.Store()) if rng.random() < 0.6 else None)
+                 for _ in range(rng.randint(1, 2))]
+        return _node(ast.With, items=items, body=_body(rng, depth))
+    if kind == 15:
+        handlers = [ast.ExceptHandler(e() if rng.random() < 0.8 else None,
+                                      rng.choice([None, "err"]), _body(rng, depth))
+                    for _ in range(rng.randint(1, 2))]
+        return ast.Try(_body(rng, depth), handlers, _body(rng, depth) if rng.random() < 0.3 else [],
+                       _body(rng, depth) if rng.random() < 0.3 else [])
+    if kind in (16, 17):
+        cls = ast.AsyncFunctionDef if kind == 17 else ast.FunctionDef
+        decorators = [e() for _ in range(rng.randint(0, 2))]
+        return _node(cls, name=rng.choice(["f", "run", "__init__"]), args=_arguments(rng, 1),
+                     body=_body(rng, depth), decorator_list=decorators,
+                     returns=_leaf(rng) if rng.random() < 0.3 else None)
+    if kind == 18:
+        keywords = [ast.keyword("metaclass", _leaf(rng))] if rng.random() < 0.2 else []
+        return _node(ast.ClassDef, name="C", bases=[_leaf(rng) for _ in range(rng.randint(0, 2))],
+                     keywords=keywords, body=_body(rng, depth), decorator_list=[])
+    return ast.Expr(e())
+
+
+def _statement_lists(tree):
+    # Every list of statements in the tree (bodies, else and finally blocks)
+    found = []
+    for node in ast.walk(tree):
+        for name in ("body", "orelse", "finalbody"):
+            value = getattr(node, name, None)
+            if isinstance(value, list) and value and isinstance(value[0], ast.stmt):
+                found.append(value)
+    return found
+
+
+def _expression_slots(tree):
+    # (parent, field, index) for every expression that is read, outside
+    # f-strings and match patterns, where any other expression can stand
+    slots = []
+    skip = (ast.JoinedStr,) + ((ast.pattern,) if hasattr(ast, "pattern") else ())
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, skip):
+            continue
+        for field, value in ast.iter_fields(node):
+            items = value if isinstance(value, list) else [value]
+            for i, item in enumerate(items):
+                if not isinstance(item, ast.AST):
+                    continue
+                if isinstance(item, ast.expr) and not isinstance(getattr(item, "ctx", None), (ast.Store, ast.Del)):
+                    slots.append((node, field, i if isinstance(value, list) else None))
+                stack.append(item)
+    return slots
+
+
+def _replace_expression(rng, tree, seeds):
+    slots = _expression_slots(tree)
+    if slots:
+        node, field, index = rng.choice(slots)
+        if index is None:
+            setattr(node, field, _expression(rng))
+        else:
+            getattr(node, field)[index] = _expression(rng)
+
+
+def _insert_statement(rng, tree, seeds):
+    body = rng.choice(_statement_lists(tree))
+    body.insert(rng.randint(0, len(body)), _statement(rng))
+
+
+def _delete_statement(rng, tree, seeds):
+    body = rng.choice(_statement_lists(tree))
+    if len(body) > 1:
+        del body[rng.randrange(len(body))]
+
+
+def _duplicate_statement(rng, tree, seeds):
+    body = rng.choice(_statement_lists(tree))
+    i = rng.randrange(len(body))
+    body.insert(i, copy.deepcopy(body[i]))
+
+
+def _splice_statement(rng, tree, seeds):
+    donor = rng.choice(_statement_lists(ast.parse(rng.choice(seeds))))
+    body = rng.choice(_statement_lists(tree))
+    body.insert(rng.randint(0, len(body)), rng.choice(donor))
+
+
+def _wrap_statements(rng, tree, seeds):
+    body = rng.choice(_statement_lists(tree))
+    start = rng.randrange(len(body))
+    end = rng.randint(start + 1, len(body))
+    wrapper = _statement(rng)
+    while not isinstance(getattr(wrapper, "body", None), list):
+        wrapper = _statement(rng)
+    wrapper.body = body[start:end]
+    body[start:end] = [wrapper]
+
+
+PYTHON_MUTATIONS = [_replace_expression, _replace_expression, _replace_expression, _insert_statement,
+                    _insert_statement, _delete_statement, _duplicate_statement, _splice_statement,
+                    _wrap_statements]
+
+
+def _add_comments(rng, text):
+    lines = text.split("\n")
+    for _ in range(rng.randint(1, 3)):
+        i = rng.randrange(len(lines))
+        indent = lines[i][:len(lines[i]) - len(lines[i].lstrip())]
+        lines.insert(i, rng.choice([indent + "# comment", "", indent + "#", "   "]))
+    if rng.random() < 0.5:
+        i = rng.randrange(len(lines))
+        if lines[i].strip() and not lines[i].rstrip().endswith("\\"):
+            lines[i] += "  # trailing"
+    return "\n".join(lines)
+
+
+def _reindent(rng, text):
+    unit = rng.choice(["  ", "\t", "        "])
+    return re.sub(r"^((?:    )+)", lambda m: unit * (len(m.group(1)) // 4), text, flags=re.M)
+
+
+def _corrupt(rng, text):
+    # Usually leaves the input unparsable, which has to be reported as such
+    if not text:
+        return text
+    i = rng.randrange(len(text))
+    if rng.random() < 0.5:
+        return text[:i] + text[i + rng.randint(1, 8):]
+    return text[:i] + rng.choice(["(", ")", ":", "\n", "    ", "'", "\\", ","]) + text[i:]
+
+
+def generate_python(rng, seeds):
+    tree = ast.parse(rng.choice(seeds))
+    for _ in range(rng.randint(1, 4)):
+        rng.choice(PYTHON_MUTATIONS)(rng, tree, seeds)
+    try:
+        text = ast.unparse(ast.fix_missing_locations(tree)) + "\n"
+    except Exception:
+        text = rng.choice(seeds)
+    if rng.random() < 0.3:
+        text = _add_comments(rng, text)
+    if rng.random() < 0.1:
+        text = _reindent(rng, text)
+    if rng.random() < 0.05:
+        text = _corrupt(rng, text)
+    return text
+
+
+# HTML generation
+
+TAGS = ["div", "span", "p", "a", "ul", "li", "b", "em", "table", "tr", "td", "section", "h1", "pre", "label",
+        "button", "form", "select", "option", "nav", "header"]
+VOID_TAGS = sorted(for_html.VOID_ELEMENTS)
+ATTRIBUTE_NAMES = ["class", "id", "href", "title", "data-x", "style", "alt", "disabled", "checked",
+                   "aria-label", "onclick", "CLASS"]
+ATTRIBUTE_VALUES = ["a", "service-item", "x y", "", "a&amp;b", "it's", 'say "hi"', "&lt;tag&gt;", "café",
+                    "  padded  ", "1", "javascript:void(0)", "R&D", "100%"]
+TEXTS = ["Hello", "a &amp; b", "1 &lt; 2", "&copy; 2024", "café", "  spaced   out  ", "line one\nline two",
+         "&#169;", "&nbsp;", "tab\tbed", "R&D", "x > y", "Service 1"]
+SCRIPTS = ["if (a < b && c) {\n  run();\n}", "var x = '</p>';", "a { color: red; }\n\n.b > .c { margin: 0 }",
+           "", "   indented();\n   more();"]
+_HTML_TOKEN = re.compile(r"<!--.*?-->|<[^>]*>|[^<]+|<", re.S)
+
+
+def _attributes(rng):
+    parts = []
+    for _ in range(rng.choice([0, 0, 1, 1, 2, 3])):
+        name = rng.choice(ATTRIBUTE_NAMES)
+        value = rng.choice(ATTRIBUTE_VALUES)
+        style = rng.randrange(4)
+        if style == 0:
+            parts.append(name)
+        elif style == 1 and re.fullmatch(r"[\w-]+", value):
+            parts.append(f"{name}={value}")
+        elif '"' not in value:
+            parts.append(f'{name}="{value}"')
+        else:
+            parts.append(f"{name}='{value}'")
+    return "".join(" " + part for part in parts)
+
+
+def _element(rng, depth=0):
+    kind = rng.randrange(10)
+    if kind == 0:
+        return f"<{rng.choice(VOID_TAGS)}{_attributes(rng)}{rng.choice(['', '/', ' /'])}>"
+    if kind == 1:
+        tag = rng.choice(["script", "style"])
+        return f"<{tag}{_attributes(rng)}>{rng.choice(SCRIPTS)}</{tag}>"
+    if kind == 2:
+        return f"<!--{rng.choice([' note ', '', 'a -- b', '<p>x</p>'])}-->"
+    if kind == 3:
+        return rng.choice(TEXTS)
+    tag = rng.choice(TAGS)
+    if rng.random() < 0.1:
+        tag = tag.upper()
+    if depth < 3:
+        inner = "".join(_element(rng, depth + 1) for _ in range(rng.randint(0, 3)))
+    else:
+        inner = rng.choice(TEXTS)
+    close = f"</{tag}>" if rng.random() < 0.9 else ""
+    return f"<{tag}{_attributes(rng)}>{inner}{close}"
+
+
+def generate_html(rng, seeds):
+    tokens = _HTML_TOKEN.findall(rng.choice(seeds))
+    for _ in range(rng.randint(1, 5)):
+        kind = rng.randrange(8)
+        i = rng.randint(0, len(tokens))
+        if kind in (0, 1):
+            tokens.insert(i, _element(rng))
+        elif kind == 2 and tokens:
+            del tokens[min(i, len(tokens) - 1)]
+        elif kind == 3 and tokens:
+            j = rng.randint(i, min(len(tokens), i + 8))
+            tokens[i:i] = tokens[i:j]
+        elif kind == 4:
+            donor = _HTML_TOKEN.findall(rng.choice(seeds))
+            start = rng.randrange(len(donor))
+            tokens[i:i] = donor[start:start + rng.randint(1, 12)]
+        elif kind == 5:
+            j = rng.randint(i, min(len(tokens), i + 6))
+            tag = rng.choice(TAGS)
+            tokens[i:j] = [f"<{tag}{_attributes(rng)}>"] + tokens[i:j] + [f"</{tag}>"]
+        elif kind == 6:
+            tokens.insert(i, rng.choice([f"</{rng.choice(TAGS)}>", f"<{rng.choice(TAGS)}>", "<!DOCTYPE html>"]))
+        else:
+            tokens.insert(i, rng.choice(["\n", "\n    ", "  ", "\n\n\t"]))
+    return "".join(tokens)
+
+
+# Checks
+
+def _ast_difference(a, b):
+    # Where two trees first differ, as (where, detail); where names the node
+    # type and field and is used to group failures
+    stack = [(a, b, type(a).__name__)]
+    while stack:
+        left, right, where = stack.pop()
+        if type(left) is not type(right):
+            return where, f"{type(left).__name__} became {type(right).__name__}"
+        if isinstance(left, ast.AST):
+            name = type(left).__name__
+            stack.extend((getattr(left, field, None), getattr(right, field, None), f"{name}.{field}")
+                         for field in reversed(left._fields))
+        elif isinstance(left, list):
+            if len(left) != len(right):
+                return where, f"{len(left)} items became {len(right)}"
+            stack.extend(zip(reversed(left), reversed(right), [where] * len(left)))
+        elif left != right:
+            return where, f"{left!r} became {right!r}"
+    return "", ""
+
+
+def _first_changed_line(a, b):
+    for number, (x, y) in enumerate(zip(a.split("\n"), b.split("\n")), 1):
+        if x != y:
+            return f"line {number}: {x.strip()!r} became {y.strip()!r}"
+    return "line count changed"
+
+
+def _generic(message):
+    # Drops the details that vary from input to input
+    return re.sub(r"'[^']*'|\"[^\"]*\"|\{.*\}|<[^>]*>|\d+", "…", message)
+
+
+def _tree(text):
+    parser = for_html.HTMLTreeBuilder()
+    parser.feed(text)
+    parser.close()
+    return parser.get_tree()
+
+
+def check(operation, text):
+    # Formats text once (timed) and checks the result. Returns (seconds,
+    # valid, failure) where valid tells whether the input parses and failure
+    # is None or (kind, signature, detail).
+    language, func = OPERATIONS[operation]
+    expected = None
+    valid = True
+    if language == "python":
+        try:
+            expected = ast.dump(ast.parse(text))
+        except (SyntaxError, ValueError):
+            valid = False
+    start = time.perf_counter()
+    try:
+        output = func(text)
+        error = None
+    except Exception as e:
+        output = None
+        error = e
+    seconds = time.perf_counter() - start
+
+    if error is not None:
+        if not valid and isinstance(error, SyntaxError):
+            return seconds, valid, None
+        if isinstance(error, RecursionError):
+            return seconds, valid, ("crash", "RecursionError", str(error))
+        return seconds, valid, ("crash", type(error).__name__ + ": " + _generic(str(error)),
+                                f"{type(error).__name__}: {error}")
+    if not valid:
+        return seconds, valid, None
+
+    if language == "python":
+        try:
+            tree = ast.parse(output)
+        except SyntaxError as e:
+            return seconds, valid, ("syntax", _generic(e.msg), f"{e.msg} on line {e.lineno}: {e.text!r}")
+        if ast.dump(tree) != expected:
+            where, detail = _ast_difference(ast.parse(text), tree)
+            return seconds, valid, ("ast", f"{where}: {_generic(detail)}", f"{where}: {detail}")
+    else:
+        difference = next(dom.diff_trees(_tree(text), _tree(output), limit=1), None)
+        if difference is not None:
+            path, message = difference
+            return seconds, valid, ("tree", _generic(message), f"at {path}: {message}")
+
+    try:
+        again = func(output)
+    except Exception as e:
+        return seconds, valid, ("idempotence", f"{type(e).__name__} on own output", f"{type(e).__name__}: {e}")
+    if again != output:
+        return seconds, valid, ("idempotence", "output changes when formatted again",
+                                _first_changed_line(output, again))
+    return seconds, valid, None
+
+
+def shrink(operation, text, failure, budget=300):
+    # Greedily drops chunks of lines, then of characters, as long as the
+    # input still fails with the same kind and signature
+    def same(candidate):
+        if not candidate.strip():
+            return False
+        result = check(operation, candidate)[2]
+        return result is not None and result[:2] == failure[:2]
+
+    def reduce(parts, joiner):
+        nonlocal budget
+        size = max(len(parts) // 2, 1)
+        while size >= 1 and budget > 0:
+            i = 0
+            while i < len(parts) and budget > 0:
+                candidate = parts[:i] + parts[i + size:]
+                budget -= 1
+                if candidate and same(joiner.join(candidate)):
+                    parts = candidate
+                else:
+                    i += size
+            size //= 2
+        return parts
+
+    text = "\n".join(reduce(text.split("\n"), "\n"))
+    return "".join(reduce(list(text), ""))
+
+
+# Running
+
+_SEEDS = None
+
+
+def load_seeds(corpus=()):
+    seeds = {"python": inputs.python_cases(), "html": inputs.html_cases()}
+    for root in corpus:
+        paths = [root] if os.path.isfile(root) else [os.path.join(folder, name)
+                                                     for folder, _, names in os.walk(root) for name in names]
+        for path in sorted(paths):
+            formatter = registry.for_path(path)
+            if formatter is None or formatter.name not in seeds:
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    text = f.read()
+                if formatter.name == "python":
+                    ast.parse(text)
+            except (OSError, UnicodeDecodeError, SyntaxError, ValueError):
+                continue
+            seeds[formatter.name].append(text)
+    return seeds
+
+
+def _init_worker(corpus):
+    global _SEEDS
+    # Mutated literals like 0.x and "\d" would warn on every parse
+    warnings.simplefilter("ignore", SyntaxWarning)
+    warnings.simplefilter("ignore", DeprecationWarning)
+    _SEEDS = load_seeds(corpus)
+    registry.warm()
+
+
+def generate(language, seed):
+    rng = random.Random(seed)
+    if language == "python":
+        return generate_python(rng, _SEEDS["python"])
+    return generate_html(rng, _SEEDS["html"])
+
+
+def run_job(job):
+    # Module-level so the process pool can pickle it. Inputs are generated
+    # in the worker from their seed, so only the failing ones travel back.
+    operation, seed = job
+    text = generate(OPERATIONS[operation][0], seed)
+    seconds, valid, failure = check(operation, text)
+    return operation, seed, len(text.encode("utf-8")), seconds, valid, failure, text if failure else None
+
+
+def percentile(values, p):
+    # Nearest-rank percentile of a sorted list
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, -(-len(values) * p // 100) - 1))]
+
+
+def run(operations, count, seed, workers, corpus, verbose=True):
+    jobs = [(operation, seed * 1_000_003 + i) for operation in operations for i in range(count)]
+    stats = {operation: {"inputs": 0, "invalid": 0, "bytes": 0, "seconds": [], "failures": {}}
+             for operation in operations}
+    groups = {}
+    started = time.perf_counter()
+    if workers == 0:
+        _init_worker(corpus)
+        results = map(run_job, jobs)
+        pool = None
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(corpus,))
+        results = pool.map(run_job, jobs, chunksize=32)
+    try:
+        for done, (operation, job_seed, size, seconds, valid, failure, text) in enumerate(results, 1):
+            entry = stats[operation]
+            entry["inputs"] += 1
+            entry["invalid"] += not valid
+            entry["bytes"] += size
+            entry["seconds"].append(seconds)
+            if failure is not None:
+                kind, signature, detail = failure
+                entry["failures"][kind] = entry["failures"].get(kind, 0) + 1
+                group = groups.setdefault((operation, kind, signature),
+                                          {"count": 0, "seed": job_seed, "detail": detail, "text": text})
+                group["count"] += 1
+                if len(text) < len(group["text"]):
+                    group.update(seed=job_seed, detail=detail, text=text)
+            if verbose and done % 1000 == 0:
+                print(f"{done}/{len(jobs)} inputs, {len(groups)} kinds of failure", file=sys.stderr, flush=True)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    wall = time.perf_counter() - started
+
+    results = {}
+    for operation, entry in stats.items():
+        seconds = sorted(entry["seconds"])
+        total = sum(seconds)
+        results[operation] = {
+            "inputs": entry["inputs"],
+            "invalid": entry["invalid"],
+            "failures": entry["failures"],
+            "latency_ms": {f"p{p:g}": percentile(seconds, p) * 1000 for p in PERCENTILES if seconds},
+            "max_ms": seconds[-1] * 1000 if seconds else None,
+            "mb_per_second": entry["bytes"] / total / 2 ** 20 if total else None,
+        }
+    failures = [{"operation": operation, "kind": kind, "signature": signature, **group}
+                for (operation, kind, signature), group in sorted(groups.items(), key=lambda item: -item[1]["count"])]
+    return results, failures, wall
+
+
+def compare(results, failures, baseline, tolerance):
+    # Returns a list of messages for failures the baseline did not have and
+    # for latency percentiles that grew by more than tolerance
+    regressions = []
+    known = {(f["operation"], f["kind"], f["signature"]) for f in baseline.get("failures", [])}
+    for failure in failures:
+        if (failure["operation"], failure["kind"], failure["signature"]) not in known:
+            regressions.append(f"{failure['operation']}: new {failure['kind']} failure: {failure['signature']}")
+    for operation, result in results.items():
+        old = baseline.get("results", {}).get(operation)
+        if old is None:
+            continue
+        for name, value in result["latency_ms"].items():
+            previous = old.get("latency_ms", {}).get(name)
+            if previous and value > previous * (1 + tolerance):
+                regressions.append(f"{operation}: {name} {previous:.3f} -> {value:.3f} ms "
+                                   f"({value / previous - 1:+.0%})")
+    return regressions
+
+
+def report(results, failures, wall, shrink_budget, show):
+    total = sum(result["inputs"] for result in results.values())
+    print(f"{total} inputs in {wall:.1f}s ({total / wall:.0f} per second)")
+    names = [f"p{p:g}" for p in PERCENTILES]
+    print(f"{'operation':<15} {'inputs':>7} {'invalid':>8} {'failed':>7} "
+          + " ".join(f"{name + ' ms':>9}" for name in names) + f" {'max ms':>9} {'MB/s':>7}")
+    for operation, result in results.items():
+        latency = result["latency_ms"]
+        print(f"{operation:<15} {result['inputs']:>7} {result['invalid']:>8} "
+              f"{sum(result['failures'].values()):>7} "
+              + " ".join(f"{latency.get(name, 0):>9.3f}" for name in names)
+              + f" {result['max_ms'] or 0:>9.3f} {result['mb_per_second'] or 0:>7.2f}")
+    for failure in failures[:show]:
+        print(f"\n{failure['operation']} {failure['kind']} x{failure['count']}: {failure['signature']}")
+        print(f"    {failure['detail']}")
+        if shrink_budget:
+            failure["text"] = shrink(failure["operation"], failure["text"],
+                                     (failure["kind"], failure["signature"]), shrink_budget)
+        lines = failure["text"].rstrip("\n").split("\n")
+        for line in lines[:15]:
+            print("    | " + line)
+        if len(lines) > 15:
+            print(f"    | ... {len(lines) - 15} more lines")
+    if len(failures) > show:
+        rest = failures[show:]
+        print(f"\n{len(rest)} more kinds of failure in {sum(f['count'] for f in rest)} inputs (see --show)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fuzz the formatters for correctness and latency.")
+    parser.add_argument("--only", nargs="+", choices=sorted(OPERATIONS), default=sorted(OPERATIONS))
+    parser.add_argument("--count", type=int, default=2000, help="inputs per operation")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: one per core, 0: run in this process)")
+    parser.add_argument("--corpus", nargs="*", default=[], help="more .py/.html files or folders to mutate")
+    parser.add_argument("--show", type=int, default=20, help="kinds of failure to print with an example")
+    parser.add_argument("--shrink-budget", type=int, default=300,
+                        help="formatter runs spent shrinking each failure (0: do not shrink)")
+    parser.add_argument("--save", metavar="FILE", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed latency growth before a percentile counts as a regression")
+    args = parser.parse_args(argv)
+
+    _init_worker(args.corpus)
+    results, failures, wall = run(args.only, args.count, args.seed, args.workers, args.corpus)
+    report(results, failures, wall, args.shrink_budget, args.show)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "formatter_versions": {name: registry.get(name).version() for name in registry.names()},
+                "seed": args.seed,
+                "count": args.count,
+                "results": results,
+                "failures": failures,
+            }, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, failures, baseline, args.tolerance)
+        for message in regressions:
+            print("REGRESSION", message)
+        return 1 if regressions else 0
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+# Benchmark harness for the formatters and visualizers.
+#
+# Runs CodeFormatter.format_code (as format_source and format_source_parallel),
+# TokenFormatter.format, HTMLFormatter.format_html, HTMLTreeBuilder on its
+# own and both visualizers over the PYTHON.txt/HTML.txt cases and over
+# generated inputs that scale in size, nesting depth and attribute count. For
+# every run it records the best wall time, throughput, the tracemalloc peak
+# and the most memory blocks that were allocated at once while it ran
+# (sys.getallocatedblocks(), sampled from a second thread about every
+# millisecond and once more at the end, less the blocks allocated before the
+# run). Results can be saved as a JSON baseline and later runs compared
+# against it.
+#
+# python.parallel runs once per --workers count and also records its speedup
+# over python.format on the same input, which shows how it scales with cores.
+#
+#   python -m benchmarks.harness --save baseline.json
+#   python -m benchmarks.harness --compare baseline.json [--tolerance 0.25]
+#   python -m benchmarks.harness --sizes 1K 1M 100M --only html.format
+#   python -m benchmarks.harness --only python.format python.parallel --sizes 10M --workers 1 2 4 8
+
+import argparse
+import ast
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+
+import for_html
+import for_python
+import registry
+from benchmarks import inputs
+
+DEFAULT_SIZES = ["1K", "10K", "100K", "1M"]
+UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(text):
+    text = text.upper()
+    if text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def python_format(text):
+    return for_python.CodeFormatter().format_source(text)
+
+
+def python_parallel(text, workers=None):
+    return for_python.CodeFormatter().format_source_parallel(text, workers=workers)
+
+
+def python_tokens(text):
+    return for_python.TokenFormatter().format(text)
+
+
+def html_format(text):
+    return for_html.HTMLFormatter().format_html(text)
+
+
+def python_visualize(text, render=False):
+    view = for_python.CodeFormatter().visualize_tree(ast.parse(text))
+    return view.pipe("svg") if render else view.dot()
+
+
+def html_tree(text):
+    parser = for_html.HTMLTreeBuilder()
+    parser.feed(text)
+    parser.close()
+    return parser.get_tree()
+
+
+def html_visualize(text, render=False):
+    parser = for_html.HTMLTreeBuilder()
+    parser.feed(text)
+    parser.close()
+    view = for_html.HTMLFormatter().visualize_html_tree(parser.get_tree())
+    return view.pipe("svg") if render else view.dot()
+
+
+OPERATIONS = {
+    "python.format": ("python", python_format),
+    "python.parallel": ("python", python_parallel),
+    "python.tokens": ("python", python_tokens),
+    "python.visualize": ("python", python_visualize),
+    "html.format": ("html", html_format),
+    "html.tree": ("html", html_tree),
+    "html.visualize": ("html", html_visualize),
+}
+
+
+def build_inputs(sizes, depths, attribute_counts):
+    # Returns {language: [(input name, text), ...]}
+    cases = {
+        "python": [(f"case{i + 1}", text) for i, text in enumerate(inputs.python_cases())],
+        "html": [(f"case{i + 1}", text) for i, text in enumerate(inputs.html_cases())],
+    }
+    for size in sizes:
+        cases["python"].append((f"size-{size}", inputs.scaled_python(parse_size(size))))
+        cases["html"].append((f"size-{size}", inputs.scaled_html(parse_size(size))))
+    for depth in depths:
+        cases["python"].append((f"depth-{depth}", inputs.nested_python(depth)))
+        cases["html"].append((f"depth-{depth}", inputs.nested_html(1, depth=depth)))
+    for count in attribute_counts:
+        cases["html"].append((f"attrs-{count}", inputs.html_with_attributes(count)))
+    return cases
+
+
+def measure(func, text, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # A separate run for memory, since tracing slows everything down. The
+    # sampling thread only gets to run when the run lets go of the GIL, so
+    # the switch interval is shortened meanwhile.
+    blocks_before = peak_blocks = sys.getallocatedblocks()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak_blocks
+        while not done.wait(0.001):
+            peak_blocks = max(peak_blocks, sys.getallocatedblocks())
+
+    sampler = threading.Thread(target=sample)
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(0.001)
+    tracemalloc.start()
+    sampler.start()
+    try:
+        result = func(text)
+        peak_blocks = max(peak_blocks, sys.getallocatedblocks())
+    finally:
+        done.set()
+        sampler.join()
+        sys.setswitchinterval(interval)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+
+    size = len(text.encode("utf-8"))
+    return {
+        "input_bytes": size,
+        "seconds": best,
+        "mb_per_second": size / best / 2 ** 20 if best else None,
+        "peak_bytes": peak,
+        "peak_blocks": peak_blocks - blocks_before,
+    }
+
+
+def _variants(name, func, render, workers):
+    # Yields (run name, function) for every way an operation is run
+    if render and name.endswith(".visualize"):
+        yield name, lambda text: func(text, render=True)
+    elif name == "python.parallel":
+        for count in workers:
+            yield f"{name}-j{count}", (lambda count: lambda text: func(text, workers=count))(count)
+    else:
+        yield name, func
+
+
+def run(operations, cases, repeat, render=False, verbose=True, workers=(1, os.cpu_count() or 1)):
+    results = {}
+    for name in operations:
+        language, func = OPERATIONS[name]
+        for run_name, variant in _variants(name, func, render, sorted(set(workers))):
+            for case, text in cases[language]:
+                key = f"{run_name}/{case}"
+                results[key] = r = measure(variant, text, repeat)
+                serial = results.get(f"python.format/{case}") if name == "python.parallel" else None
+                if serial is not None:
+                    r["speedup"] = serial["seconds"] / r["seconds"] if r["seconds"] else None
+                if verbose:
+                    print(f"{key:<34} {r['input_bytes'] / 1024:>10.1f} {r['seconds']:>10.4f} "
+                          f"{r['mb_per_second'] or 0:>9.2f} {r['peak_bytes'] / 2 ** 20:>9.1f} "
+                          f"{r['peak_blocks']:>11}" + (f" {r['speedup']:>7.2f}x" if r.get("speedup") else ""),
+                          flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # Returns a list of messages for runs that got slower or hungrier than
+    # the baseline by more than tolerance
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get("results", {}).get(key)
+        if old is None:
+            continue
+        for metric in ("seconds", "peak_bytes", "peak_blocks"):
+            if old.get(metric) and result[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{key}: {metric} {old[metric]:.6g} -> {result[metric]:.6g} "
+                                   f"({result[metric] / old[metric] - 1:+.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the formatters and visualizers.")
+    parser.add_argument("--only", nargs="+", choices=sorted(OPERATIONS), default=sorted(OPERATIONS))
+    parser.add_argument("--sizes", nargs="*", default=DEFAULT_SIZES,
+                        help="generated input sizes, e.g. 1K 10M 100M")
+    parser.add_argument("--depths", nargs="*", type=int, default=[10, 50, 500])
+    parser.add_argument("--attributes", nargs="*", type=int, default=[1, 10, 100])
+    parser.add_argument("--workers", nargs="*", type=int, default=[1, os.cpu_count() or 1],
+                        help="worker counts to run python.parallel with (default: 1 and one per core)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--render", action="store_true", help="also run Graphviz on the visualizations")
+    parser.add_argument("--save", metavar="FILE", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown or memory growth before a run counts as a regression")
+    args = parser.parse_args(argv)
+
+    cases = build_inputs(args.sizes, args.depths, args.attributes)
+    print(f"{'run':<34} {'input KB':>10} {'seconds':>10} {'MB/s':>9} {'peak MB':>9} {'peak blocks':>11} {'speedup':>8}")
+    results = run(args.only, cases, args.repeat, args.render, workers=args.workers)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "formatter_versions": {name: registry.get(name).version() for name in registry.names()},
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for message in regressions:
+            print("REGRESSION", message)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
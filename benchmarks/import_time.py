@@ -0,0 +1,58 @@
+# Import-time benchmark for the headless modules.
+#
+# Imports each module in a fresh interpreter, reports the best time the import
+# statement took over a few runs and fails if a module pulls in any of the GUI
+# or visualization dependencies, or is slower than the budget.
+#
+#   python -m benchmarks.import_time [--runs 5] [--budget-ms 50]
+
+import argparse
+import os
+import subprocess
+import sys
+
+MODULES = ["emitter", "cache", "registry", "for_python", "for_html", "cli"]
+FORBIDDEN = ["tkinter", "graphviz", "PIL", "networkx"]
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [name for name in {forbidden!r} if name in sys.modules]
+print(elapsed, ",".join(loaded))
+"""
+
+
+def probe(module, runs):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    best = None
+    loaded = ""
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", PROBE.format(module=module, forbidden=FORBIDDEN)],
+                                cwd=root, capture_output=True, text=True, check=True).stdout.split()
+        elapsed = float(output[0])
+        loaded = output[1] if len(output) > 1 else ""
+        best = elapsed if best is None else min(best, elapsed)
+    return best, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':<12} {'ms':>8}  heavy imports")
+    for module in MODULES:
+        seconds, loaded = probe(module, args.runs)
+        ms = seconds * 1000
+        print(f"{module:<12} {ms:>8.2f}  {loaded or '-'}")
+        if loaded or ms > args.budget_ms:
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
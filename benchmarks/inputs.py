@@ -0,0 +1,90 @@
+# Benchmark inputs: the hand-written cases from PYTHON.txt and HTML.txt, and
+# generated documents that scale in size, nesting depth and attribute count.
+
+import os
+import re
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Indentation beyond this is rejected by the Python tokenizer
+MAX_PYTHON_NESTING = 90
+
+
+def load_cases(path):
+    # The files consist of a title line followed by "CASE n" (or "CASE n:")
+    # headers, each followed by one input
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    parts = re.split(r"^CASE \d+:?[ \t]*$", text, flags=re.M)
+    return [part.strip("\n") + "\n" for part in parts[1:] if part.strip()]
+
+
+def python_cases():
+    return load_cases(os.path.join(ROOT, "PYTHON.txt"))
+
+
+def html_cases():
+    return load_cases(os.path.join(ROOT, "HTML.txt"))
+
+
+def scaled_python(size):
+    # Repeats the PYTHON.txt cases until the module is about size characters
+    cases = python_cases()
+    parts = []
+    total = i = 0
+    while total < size:
+        case = cases[i % len(cases)]
+        parts.append(case)
+        total += len(case)
+        i += 1
+    return "".join(parts)
+
+
+def scaled_html(size):
+    # The <body> contents of the HTML.txt cases, repeated inside one page
+    # until it is about size characters
+    bodies = []
+    for case in html_cases():
+        match = re.search(r"<body>(.*)</body>", case, flags=re.S)
+        bodies.append(match.group(1) if match else case)
+    parts = []
+    total = i = 0
+    while total < size:
+        body = bodies[i % len(bodies)]
+        parts.append(body)
+        total += len(body)
+        i += 1
+    return "<!DOCTYPE html><html><head><title>Scaled</title></head><body>" + "".join(parts) + "</body></html>"
+
+
+def nested_html(blocks, depth=200, width=4):
+    # blocks of depth nested <div>s, each holding a few paragraphs
+    paragraphs = "".join(f"<p class=\"item\">text {i}</p>" for i in range(width))
+    return ("<div>" * depth + paragraphs + "</div>" * depth) * blocks
+
+
+def nested_python(depth):
+    depth = min(depth, MAX_PYTHON_NESTING)
+    lines = ["def f(x):"]
+    for level in range(1, depth + 1):
+        lines.append("    " * level + f"if x > {level}:")
+    lines.append("    " * (depth + 1) + "return x")
+    return "\n".join(lines) + "\n"
+
+
+def python_module(functions):
+    body = "    total = 0\n    for i in range(n):\n        if i % 2 == 0:\n            total += i\n    return total\n"
+    return "".join(f"def f{i}(n):\n{body}\n" for i in range(functions))
+
+
+def html_with_attributes(count, elements=1000):
+    attrs = " ".join(f'data-a{i}="value {i}"' for i in range(count))
+    return "<div>" + "".join(f"<span {attrs}>x</span>" for _ in range(elements)) + "</div>"
+
+
+def service_page(sections):
+    # Mostly small elements and text nodes, as on real pages
+    item = ('<div class="service-item"><h3>Service {i}</h3><p>Some text about '
+            'service {i}.</p><img src="s{i}.png" alt="Service {i}"><br><a href="#s{i}">More</a></div>')
+    body = "".join(item.format(i=i) for i in range(sections))
+    return f"<!DOCTYPE html><html><head><title>Big</title></head><body>{body}</body></html>"
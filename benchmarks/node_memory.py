@@ -0,0 +1,100 @@
+# Memory benchmark for the HTML tree.
+#
+# Builds the tree for a generated document in a fresh process with each of
+#
+#   dict    the Node before __slots__, with a fresh attrs dict per element
+#   slots   the __slots__ Node, still with fresh attrs and text strings
+#   shared  the builder as it is: interned names, shared attribute values
+#           and mappings, and text kept as spans of the source
+#
+# and prints the memory held by the finished tree and the peak while building
+# it (tracemalloc), the number of memory blocks the tree holds, and the peak
+# RSS of the process.
+#
+#   python -m benchmarks.node_memory [--sections 20000]
+#   python -m benchmarks.node_memory --html-mb 100   (HTML.txt cases scaled up)
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.inputs import scaled_html, service_page
+
+
+# Node as it was before __slots__: a __dict__, a fresh attrs dict and children
+# list on every node, and two flags instead of a kind
+class DictNode:
+    def __init__(self, tag=None, attrs=None, data=None, is_comment=False, is_doctype=False, kind=None):
+        self.tag = tag
+        self.attrs = attrs if attrs is not None else {}
+        self.data = data
+        self.children = []
+        self.is_comment = is_comment
+        self.is_doctype = is_doctype
+        self.kind = kind
+
+    def add_child(self, node):
+        self.children.append(node)
+
+
+def build(variant, document):
+    import resource
+    import tracemalloc
+
+    import for_html
+    if variant != "shared":
+        for_html.HTMLTreeBuilder._attributes = lambda self, attrs: dict(attrs)
+    if variant == "dict":
+        for_html.Node = DictNode
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    parser = for_html.HTMLTreeBuilder(source=document if variant == "shared" else None)
+    parser.feed(document)
+    parser.close()
+    # The builder's lookup tables go away with it; only the tree is kept
+    tree = parser.get_tree()
+    del parser
+    tree_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sys.getallocatedblocks() - blocks
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    del tree
+    return {"tree_bytes": tree_bytes, "peak_bytes": peak_bytes, "blocks": blocks, "peak_rss": peak_rss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sections", type=int, default=20000)
+    parser.add_argument("--html-mb", type=float, help="use the HTML.txt cases scaled to this size instead")
+    parser.add_argument("--variant", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        if args.html_mb:
+            document = scaled_html(int(args.html_mb * 2**20))
+        else:
+            document = service_page(args.sections)
+        print(json.dumps(build(args.variant, document)))
+        return
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    size = ["--html-mb", str(args.html_mb)] if args.html_mb else ["--sections", str(args.sections)]
+    results = {}
+    for variant in ("dict", "slots", "shared"):
+        output = subprocess.run([sys.executable, "-m", "benchmarks.node_memory", "--variant", variant, *size],
+                                cwd=root, capture_output=True, text=True, check=True).stdout
+        results[variant] = json.loads(output)
+
+    print(f"{'variant':<8} {'tree MB':>10} {'peak MB':>10} {'blocks':>12} {'peak RSS MB':>12}")
+    for variant, result in results.items():
+        print(f"{variant:<8} {result['tree_bytes'] / 2**20:>10.1f} {result['peak_bytes'] / 2**20:>10.1f} "
+              f"{result['blocks']:>12,} {result['peak_rss'] / 2**20:>12.1f}")
+    for variant in ("slots", "shared"):
+        ratio = results[variant]["tree_bytes"] / results["dict"]["tree_bytes"]
+        print(f"{variant} tree uses {ratio:.0%} of the dict-based tree")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# Persistent on-disk cache of formatter output.
+#
+# Entries are keyed by a hash of the input together with everything that
+# affects the output (language, formatter version, indent size), so a hit can
+# be returned without parsing. Each entry is one file under
+# <directory>/<key[:2]>/<key>. Writes go to a temporary file that is renamed
+# into place, so concurrent writers never leave a partial entry behind. Reads
+# bump the entry's mtime and prune() drops the least recently used entries
+# until the cache fits in max_size bytes.
+#
+# The cache is only an optimization: an entry that cannot be read is a miss,
+# and when entries cannot be written (read-only or full disk, a cache
+# directory that is not one) put() warns once per process and formatting
+# goes on uncached.
+
+import hashlib
+import os
+import sys
+import time
+
+DEFAULT_DIRECTORY = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                                 "codeneatly")
+
+
+# Temporary files younger than this may still be renamed into place by
+# another writer; older ones were left behind by a writer that died
+TEMP_MAX_AGE = 3600
+
+_warned = False
+
+
+class FormatCache:
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_size=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, language, text, indent_size, version):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{language}\0{version}\0{indent_size}\0".encode())
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8", newline="") as f:
+                value = f.read()
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def _warn(self, error):
+        global _warned
+        if not _warned:
+            _warned = True
+            print(f"warning: not caching results in {self.directory}: {error}", file=sys.stderr)
+
+    def writable(self):
+        # Tries to create a file in the cache, so callers can drop a cache
+        # that cannot be written before handing it to worker processes
+        import tempfile
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            os.close(fd)
+            os.unlink(tmp)
+        except OSError as e:
+            self._warn(e)
+            return False
+        return True
+
+    def put(self, key, value):
+        # Returns whether the entry was written
+        try:
+            self._write(key, value)
+        except OSError as e:
+            self._warn(e)
+            return False
+        return True
+
+    def _write(self, key, value):
+        import tempfile
+        path = self._path(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                f.write(value)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def prune(self):
+        # Returns the number of entries removed
+        entries = []
+        total = 0
+        stale = time.time() - TEMP_MAX_AGE
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if name.startswith(".tmp-"):
+                    # Another writer may be about to rename it into place
+                    if st.st_mtime < stale:
+                        try:
+                            os.unlink(path)
+                        except OSError:
+                            pass
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        removed = 0
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
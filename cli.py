@@ -0,0 +1,181 @@
+# Command-line front end for formatting files without the GUI.
+#
+#   python cli.py src/ "templates/**/*.html"        formatted output to stdout
+#   python cli.py --in-place src/                   rewrite files
+#   python cli.py --check src/                      exit 1 if anything would change
+#   python cli.py --diff -j 8 src/                  unified diffs, 8 worker processes
+#
+# Files are routed by extension to their formatter in the registry (see
+# registry.py). Each file is formatted independently, so the work is spread
+# over a process pool. Results are kept in a FormatCache (see cache.py), and
+# files whose output is already cached never reach the pool.
+
+import argparse
+import difflib
+import glob
+import os
+import sys
+
+import registry
+from cache import DEFAULT_DIRECTORY, FormatCache
+
+SKIP_DIRS = {".git", ".hg", ".svn", "__pycache__", ".tox", ".nox", ".venv", "venv", "node_modules"}
+
+
+def collect_files(patterns):
+    files = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = []
+            for dirpath, dirnames, filenames in os.walk(pattern):
+                dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+                matches.extend(os.path.join(dirpath, name) for name in sorted(filenames))
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        for path in matches:
+            if registry.for_path(path) is not None and path not in seen:
+                seen.add(path)
+                files.append(path)
+    return files
+
+
+def replace_file(path, text):
+    # Written to a temporary file next to it and renamed over it, so an
+    # interrupted run never leaves a truncated file behind
+    import tempfile
+    path = os.path.realpath(path)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+# Runs in a worker process. Returns (path, status, text) where status is
+# "unchanged", "changed" or "error" and text is whatever should be printed.
+# With cached_only=True, returns None instead of formatting on a cache miss.
+def process_file(path, mode, indent_size, cache=None, cached_only=False):
+    formatter = registry.for_path(path)
+    try:
+        with open(path, encoding="utf-8") as f:
+            original = f.read()
+        formatted = key = None
+        if cache is not None:
+            key = cache.key(formatter.name, original, indent_size, formatter.version())
+            formatted = cache.get(key)
+        if formatted is None:
+            if cached_only:
+                return None
+            formatted = formatter.format(original, indent_size)
+            if cache is not None:
+                cache.put(key, formatted)
+    except (OSError, UnicodeDecodeError, SyntaxError) as e:
+        return path, "error", f"{path}: {e}"
+    except Exception as e:
+        # RecursionError, MemoryError, ... from deeply nested input; one bad
+        # file must not take the rest of the run down with it
+        return path, "error", f"{path}: {type(e).__name__}" + (f": {e}" if str(e) else "")
+
+    status = "changed" if formatted != original else "unchanged"
+    if mode == "stdout":
+        return path, status, formatted
+    if mode == "diff":
+        diff = difflib.unified_diff(original.splitlines(True), formatted.splitlines(True),
+                                    fromfile=path, tofile=path)
+        return path, status, "".join(line if line.endswith("\n") else line + "\n\\ No newline at end of file\n"
+                                     for line in diff)
+    if mode == "in-place" and status == "changed":
+        # The file is only rewritten when the formatter vouches for the result
+        try:
+            formatter.verify(original, formatted)
+            replace_file(path, formatted)
+        except Exception as e:
+            return path, "error", f"{path}: not rewritten: {e}"
+        return path, status, f"reformatted {path}"
+    if mode == "check" and status == "changed":
+        return path, status, f"would reformat {path}"
+    return path, status, ""
+
+
+def run(files, mode, indent_size=4, workers=None, cache=None):
+    # Returns process_file results in the order of files
+    if cache is not None:
+        results = [process_file(path, mode, indent_size, cache, cached_only=True) for path in files]
+    else:
+        results = [None] * len(files)
+    missing = [i for i, result in enumerate(results) if result is None]
+    if cache is not None and missing and not cache.writable():
+        cache = None
+
+    if workers == 1 or len(missing) < 2:
+        for i in missing:
+            results[i] = process_file(files[i], mode, indent_size, cache)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        paths = [files[i] for i in missing]
+        chunksize = max(1, len(paths) // ((workers or os.cpu_count() or 1) * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            formatted = pool.map(process_file, paths, [mode] * len(paths), [indent_size] * len(paths),
+                                 [cache] * len(paths), chunksize=chunksize)
+            for i, result in zip(missing, formatted):
+                results[i] = result
+    # Only runs that wrote new entries can push the cache over its size limit
+    if cache is not None and missing:
+        cache.prune()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Format source files (" + ", ".join(registry.extensions()) + ").")
+    parser.add_argument("paths", nargs="+", help="files, directories or glob patterns")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("-i", "--in-place", action="store_const", dest="mode", const="in-place",
+                       help="rewrite files with their formatted version")
+    group.add_argument("--check", action="store_const", dest="mode", const="check",
+                       help="only report files that would change")
+    group.add_argument("--diff", action="store_const", dest="mode", const="diff",
+                       help="print a unified diff for each file that would change")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes (default: one per core)")
+    parser.add_argument("--indent-size", type=int, default=4)
+    parser.add_argument("--cache-dir", default=DEFAULT_DIRECTORY,
+                        help=f"where formatted results are cached (default: {DEFAULT_DIRECTORY})")
+    parser.add_argument("--cache-size", type=int, default=256,
+                        help="maximum cache size in MB; least recently used entries go first")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the cache")
+    parser.set_defaults(mode="stdout")
+    args = parser.parse_args(argv)
+    cache = None if args.no_cache else FormatCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+    files = collect_files(args.paths)
+    if not files:
+        print("no files to format found", file=sys.stderr)
+        return 2
+
+    changed = errors = 0
+    for path, status, text in run(files, args.mode, args.indent_size, args.workers, cache):
+        if status == "error":
+            errors += 1
+            print(text, file=sys.stderr)
+            continue
+        changed += status == "changed"
+        if text:
+            sys.stdout.write(text if text.endswith("\n") else text + "\n")
+
+    if errors:
+        return 2
+    return 1 if args.mode == "check" and changed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+# Long-lived formatting server, so editors and pre-commit hooks do not pay
+# for interpreter startup and the formatter imports on every file.
+#
+#   python daemon.py serve [-j 4]             start the server (foreground)
+#   python daemon.py format a.py b.html       formatted output to stdout
+#   python daemon.py format --check src/x.py  exit 1 if anything would change
+#   python daemon.py stop
+#
+# The server listens on a Unix domain socket and speaks JSON lines: every
+# request is one JSON object on one line and gets exactly one line back.
+# A connection can carry any number of requests.
+#
+#   {"language": "python", "text": "...", "indent_size": 4}
+#       -> {"ok": true, "text": "..."}  or  {"ok": false, "error": "..."}
+#   {"op": "ping"}      -> {"ok": true, "pid": 1234}
+#   {"op": "shutdown"}  -> {"ok": true}
+#
+# Each connection is served by its own thread; the formatting itself runs in
+# a pool of worker processes that import the formatters once at startup
+# (-j 0 formats on the connection threads instead). Languages are the ones in
+# registry.py; the client side only imports the registry, socket and json.
+#
+# A request that is not formatted within --timeout seconds gets an error
+# back. The worker stops it with an alarm signal; if that does not work
+# either, the workers are killed. A pool whose worker was killed (by that, or
+# by the OOM killer) is replaced by a fresh one, so the server keeps working.
+# With -j 0 there is no timeout.
+#
+# The socket lives in a directory of its own that the server creates with
+# mode 0700 and refuses to use unless it belongs to the same user, and the
+# client only talks to a socket (and, where the platform can tell, a server
+# process) owned by its own user. Otherwise anybody who got to the path
+# first would be sent every file and could choose what format -i writes.
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+import registry
+
+DEFAULT_SOCKET = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or "/tmp", f"codeneatly-{os.getuid()}", "daemon.sock")
+
+
+DEFAULT_TIMEOUT = 20.0
+
+
+# Runs in a worker process, on its main thread, where an alarm signal can
+# interrupt formatting that takes too long
+def _format_with_timeout(timeout, language, text, indent_size):
+    import signal
+
+    def expire(signum, frame):
+        raise TimeoutError(f"not formatted within {timeout} seconds")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return registry.format_text(language, text, indent_size)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class WorkerPool:
+    # A process pool that is replaced when one of its workers dies
+    def __init__(self, workers=None, timeout=DEFAULT_TIMEOUT):
+        import threading
+        self.workers = workers
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pool = self._start()
+
+    def _start(self):
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=registry.warm)
+
+    def format(self, language, text, indent_size=4):
+        import concurrent.futures
+        from concurrent.futures.process import BrokenProcessPool
+        pool = self._pool
+        try:
+            future = pool.submit(_format_with_timeout, self.timeout, language, text, indent_size)
+        except BrokenProcessPool:
+            # Broken while idle or by an earlier request; this one never ran
+            self._replace(pool)
+            pool = self._pool
+            future = pool.submit(_format_with_timeout, self.timeout, language, text, indent_size)
+        try:
+            # The worker raises TimeoutError itself; this only runs out when
+            # it is stuck somewhere the alarm cannot interrupt
+            return future.result(self.timeout + 5)
+        except concurrent.futures.TimeoutError:
+            self._replace(pool, kill=True)
+            raise TimeoutError(f"not formatted within {self.timeout} seconds") from None
+        except BrokenProcessPool:
+            self._replace(pool)
+            message = "a worker process died while formatting; the workers have been restarted"
+            raise BrokenProcessPool(message) from None
+
+    def _replace(self, pool, kill=False):
+        # Requests that saw the same pool break all end up here; only the
+        # first one starts a new pool
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = self._start()
+        if kill:
+            # ProcessPoolExecutor has no public way to stop a running task
+            for process in list((pool._processes or {}).values()):
+                process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        self._pool.shutdown(cancel_futures=True)
+
+
+def handle_request(request, pool=None):
+    # Returns the response for one decoded request
+    op = request.get("op", "format")
+    if op == "ping":
+        return {"ok": True, "pid": os.getpid()}
+    if op != "format":
+        return {"ok": False, "error": f"unknown op {op!r}"}
+    language = request.get("language")
+    if language not in registry.names():
+        return {"ok": False, "error": f"unknown language {language!r}"}
+    args = (language, request.get("text", ""), request.get("indent_size", 4))
+    try:
+        text = pool.format(*args) if pool is not None else registry.format_text(*args)
+    except SyntaxError as e:
+        return {"ok": False, "error": f"SyntaxError: {e}"}
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    return {"ok": True, "text": text}
+
+
+def _private_directory(path):
+    import stat
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(f"{path} must be a directory owned by this user that only this user can access "
+                           f"(mode 0700)")
+
+
+def serve(path=DEFAULT_SOCKET, workers=None, timeout=DEFAULT_TIMEOUT):
+    import socketserver
+    import threading
+
+    _private_directory(os.path.dirname(os.path.abspath(path)))
+    # A socket file nobody answers on is left over from a crashed server
+    if os.path.exists(path):
+        if ping(path) is not None:
+            raise RuntimeError(f"a server is already listening on {path}")
+        os.unlink(path)
+
+    pool = WorkerPool(workers, timeout) if workers != 0 else None
+    if pool is None:
+        registry.warm()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError(f"expected a JSON object, got {type(request).__name__}")
+                except ValueError as e:
+                    response = {"ok": False, "error": f"bad request: {e}"}
+                else:
+                    if request.get("op") == "shutdown":
+                        self._send({"ok": True})
+                        threading.Thread(target=self.server.shutdown).start()
+                        return
+                    response = handle_request(request, pool)
+                self._send(response)
+
+        def _send(self, response):
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+    class Server(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+    old_umask = os.umask(0o177)
+    try:
+        server = Server(path, Handler)
+    finally:
+        os.umask(old_umask)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if pool is not None:
+            pool.shutdown()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class Client:
+    def __init__(self, path=DEFAULT_SOCKET, timeout=30.0):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.settimeout(timeout)
+            owner = os.stat(path).st_uid
+            if owner != os.getuid():
+                raise PermissionError(f"{path} belongs to uid {owner}, not to this user")
+            self.sock.connect(path)
+            # The path may have been swapped between the stat and the connect
+            if hasattr(socket, "SO_PEERCRED"):
+                import struct
+                credentials = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+                pid, owner, group = struct.unpack("3i", credentials)
+                if owner != os.getuid():
+                    raise PermissionError(f"the server on {path} runs as uid {owner}, not as this user")
+        except BaseException:
+            self.sock.close()
+            raise
+        self.file = self.sock.makefile("rwb")
+
+    def request(self, request):
+        self.file.write(json.dumps(request).encode("utf-8") + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        return json.loads(line)
+
+    def format(self, language, text, indent_size=4):
+        # Returns the formatted text, or raises ValueError with the server's error
+        response = self.request({"language": language, "text": text, "indent_size": indent_size})
+        if not response["ok"]:
+            raise ValueError(response["error"])
+        return response["text"]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def ping(path=DEFAULT_SOCKET):
+    # Returns the server's pid, or None if nothing is listening
+    try:
+        with Client(path, timeout=2.0) as client:
+            return client.request({"op": "ping"})["pid"]
+    except (OSError, ValueError):
+        return None
+
+
+def format_files(paths, mode, indent_size, path=DEFAULT_SOCKET):
+    # Same output and exit codes as cli.py
+    changed = errors = 0
+    with Client(path) as client:
+        for name in paths:
+            formatter = registry.for_path(name)
+            try:
+                if formatter is None:
+                    raise ValueError("no formatter for this file type")
+                with open(name, encoding="utf-8") as f:
+                    original = f.read()
+                formatted = client.format(formatter.name, original, indent_size)
+            except (OSError, UnicodeDecodeError, ValueError) as e:
+                errors += 1
+                print(f"{name}: {e}", file=sys.stderr)
+                continue
+            changed += formatted != original
+            if mode == "stdout":
+                sys.stdout.write(formatted)
+            elif formatted == original:
+                continue
+            elif mode == "in-place":
+                from cli import replace_file
+                try:
+                    formatter.verify(original, formatted)
+                    replace_file(name, formatted)
+                except Exception as e:
+                    errors += 1
+                    print(f"{name}: not rewritten: {e}", file=sys.stderr)
+                    continue
+                print(f"reformatted {name}")
+            else:
+                print(f"would reformat {name}")
+    if errors:
+        return 2
+    return 1 if mode == "check" and changed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Formatting server and client.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET,
+                        help=f"socket path, in a directory only this user can access (default: {DEFAULT_SOCKET})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run the server in the foreground")
+    serve_parser.add_argument("-j", "--workers", type=int, default=None,
+                              help="worker processes (default: one per core, 0: format in the server process)")
+    serve_parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                              help=f"seconds a request may take (default: {DEFAULT_TIMEOUT:g}; ignored with -j 0)")
+    format_parser = commands.add_parser("format", help="format files through the server")
+    format_parser.add_argument("paths", nargs="+")
+    group = format_parser.add_mutually_exclusive_group()
+    group.add_argument("-i", "--in-place", action="store_const", dest="mode", const="in-place")
+    group.add_argument("--check", action="store_const", dest="mode", const="check")
+    format_parser.add_argument("--indent-size", type=int, default=4)
+    format_parser.set_defaults(mode="stdout")
+    commands.add_parser("ping", help="print the server's pid")
+    commands.add_parser("stop", help="shut the server down")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            serve(args.socket, args.workers, args.timeout)
+        except KeyboardInterrupt:
+            pass
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            return 2
+        return 0
+    try:
+        if args.command == "format":
+            return format_files(args.paths, args.mode, args.indent_size, args.socket)
+        with Client(args.socket) as client:
+            response = client.request({"op": "ping" if args.command == "ping" else "shutdown"})
+        if args.command == "ping":
+            print(response["pid"])
+        return 0
+    except OSError as e:
+        print(f"cannot reach the server on {args.socket}: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
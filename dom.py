@@ -0,0 +1,262 @@
+# Queries and diffs on the trees built by for_html.HTMLTreeBuilder.
+#
+# A DOMIndex maps tag names, ids and classes to their elements (in document
+# order) and remembers each element's parent. HTMLTreeBuilder(index=True)
+# fills one while parsing; DOMIndex(tree) builds one for an existing tree.
+# select() takes CSS-style selectors and starts from the smallest matching
+# index list instead of walking the document:
+#
+#   index.select("img:not([alt])")
+#   index.select("#main > ul li.active, a[href^='http']")
+#
+# Supported: tag names and *, #id, .class, [attr], [attr=v], [attr~=v],
+# [attr^=v], [attr$=v], [attr*=v], [attr|=v], :not(...) with a compound
+# selector inside, the descendant (space) and child (>) combinators, and
+# comma-separated groups.
+#
+# diff_trees() walks two trees side by side, e.g. one parsed from a page and
+# one parsed from its formatted version, and reports where they differ.
+
+import re
+
+from for_html import NodeKind
+
+
+class SelectorError(ValueError):
+    pass
+
+
+_NAME = re.compile(r"-?[A-Za-z_][\w-]*|\*")
+_IDENT = re.compile(r"-?[A-Za-z_][\w-]*")
+_ATTRIBUTE = re.compile(r"""\[\s*([^\s~^$*|=\]]+)\s*(?:([~^$*|]?=)\s*(?:"([^"]*)"|'([^']*)'|([^\s\]]+))\s*)?\]""")
+_COMBINATOR = re.compile(r"\s*(>|,)\s*|\s+")
+
+
+def _skip_spaces(text, pos):
+    while pos < len(text) and text[pos].isspace():
+        pos += 1
+    return pos
+
+
+# A compound selector is (tag, ids, classes, attributes, negations) where
+# attributes are (name, operator, value) and negations are compounds
+def _parse_compound(text, pos):
+    tag = None
+    ids, classes, attributes, negations = [], [], [], []
+    start = pos
+    match = _NAME.match(text, pos)
+    if match:
+        tag = match.group().lower()
+        pos = match.end()
+    while pos < len(text):
+        char = text[pos]
+        if char in "#.":
+            match = _IDENT.match(text, pos + 1)
+            if not match:
+                raise SelectorError(f"expected a name at {pos + 1} in {text!r}")
+            (ids if char == "#" else classes).append(match.group())
+            pos = match.end()
+        elif char == "[":
+            match = _ATTRIBUTE.match(text, pos)
+            if not match:
+                raise SelectorError(f"bad attribute selector at {pos} in {text!r}")
+            name, op, *values = match.groups()
+            value = next((v for v in values if v is not None), None)
+            attributes.append((name.lower(), op, value))
+            pos = match.end()
+        elif text.startswith(":not(", pos):
+            inner, pos = _parse_compound(text, _skip_spaces(text, pos + 5))
+            pos = _skip_spaces(text, pos)
+            if not text.startswith(")", pos):
+                raise SelectorError(f"expected ) at {pos} in {text!r}")
+            negations.append(inner)
+            pos += 1
+        else:
+            break
+    if pos == start:
+        raise SelectorError(f"expected a selector at {pos} in {text!r}")
+    return (tag, ids, classes, attributes, negations), pos
+
+
+# Returns a list of groups; each group is a list [compound, combinator,
+# compound, ...] with combinators " " or ">"
+def parse_selector(text):
+    groups = []
+    parts = []
+    pos = _skip_spaces(text, 0)
+    end = len(text.rstrip())
+    while True:
+        compound, pos = _parse_compound(text, pos)
+        parts.append(compound)
+        if pos >= end:
+            break
+        match = _COMBINATOR.match(text, pos)
+        if not match:
+            raise SelectorError(f"unexpected {text[pos]!r} at {pos} in {text!r}")
+        pos = match.end()
+        if match.group(1) == ",":
+            groups.append(parts)
+            parts = []
+        else:
+            parts.append(match.group(1) or " ")
+    groups.append(parts)
+    return groups
+
+
+def _attribute_matches(attrs, name, op, value):
+    if name not in attrs:
+        return False
+    if op is None:
+        return True
+    actual = attrs[name] or ""
+    if op == "=":
+        return actual == value
+    if op == "~=":
+        return value in actual.split()
+    if op == "^=":
+        return bool(value) and actual.startswith(value)
+    if op == "$=":
+        return bool(value) and actual.endswith(value)
+    if op == "*=":
+        return bool(value) and value in actual
+    return actual == value or actual.startswith(value + "-")
+
+
+def matches(node, compound):
+    if node.kind is not NodeKind.ELEMENT:
+        return False
+    tag, ids, classes, attributes, negations = compound
+    if tag is not None and tag != "*" and node.tag.lower() != tag:
+        return False
+    attrs = node.attrs
+    for id_ in ids:
+        if attrs.get("id") != id_:
+            return False
+    if classes:
+        names = (attrs.get("class") or "").split()
+        if any(name not in names for name in classes):
+            return False
+    for name, op, value in attributes:
+        if not _attribute_matches(attrs, name, op, value):
+            return False
+    for negation in negations:
+        if matches(node, negation):
+            return False
+    return True
+
+
+class DOMIndex:
+    def __init__(self, root=None):
+        self.root = root
+        self.elements = []
+        self.by_tag = {}
+        self.by_id = {}
+        self.by_class = {}
+        self.parents = {}
+        self._positions = None
+        if root is not None:
+            stack = [(child, root) for child in reversed(root.children)]
+            while stack:
+                node, parent = stack.pop()
+                if node.kind is NodeKind.ELEMENT:
+                    self.add(node, parent)
+                    stack.extend((child, node) for child in reversed(node.children))
+
+    # Elements have to be added in document order
+    def add(self, node, parent):
+        self.elements.append(node)
+        self.parents[node] = parent
+        self.by_tag.setdefault(node.tag.lower(), []).append(node)
+        attrs = node.attrs
+        if attrs:
+            id_ = attrs.get("id")
+            if id_:
+                self.by_id.setdefault(id_, []).append(node)
+            classes = attrs.get("class")
+            if classes:
+                for name in set(classes.split()):
+                    self.by_class.setdefault(name, []).append(node)
+        self._positions = None
+
+    def _candidates(self, compound):
+        tag, ids, classes, attributes, negations = compound
+        lists = [self.by_id.get(id_, ()) for id_ in ids]
+        lists += [self.by_class.get(name, ()) for name in classes]
+        if tag is not None and tag != "*":
+            lists.append(self.by_tag.get(tag, ()))
+        return min(lists, key=len) if lists else self.elements
+
+    def _matches_complex(self, node, parts, i):
+        # parts[i] is a compound that node matches; check what is left of it
+        if i == 0:
+            return True
+        combinator, compound = parts[i - 1], parts[i - 2]
+        parent = self.parents.get(node)
+        while parent is not None and parent is not self.root:
+            if matches(parent, compound) and self._matches_complex(parent, parts, i - 2):
+                return True
+            if combinator == ">":
+                return False
+            parent = self.parents.get(parent)
+        return False
+
+    def select(self, selector):
+        # Matching elements in document order
+        groups = parse_selector(selector)
+        found = []
+        for parts in groups:
+            last = parts[-1]
+            found.extend(node for node in self._candidates(last)
+                         if matches(node, last) and self._matches_complex(node, parts, len(parts) - 1))
+        if len(groups) > 1:
+            if self._positions is None:
+                self._positions = {node: i for i, node in enumerate(self.elements)}
+            found = sorted(set(found), key=self._positions.__getitem__)
+        return found
+
+    def select_one(self, selector):
+        found = self.select(selector)
+        return found[0] if found else None
+
+
+def _describe(node):
+    if node.kind is NodeKind.ELEMENT:
+        return f"<{node.tag}>"
+    if node.kind is NodeKind.TEXT:
+        return "text " + repr(node.data if len(node.data) <= 30 else node.data[:29] + "…")
+    return node.kind.name.lower()
+
+
+# Yields (path, message) for every difference between two trees, where path
+# is the child-index path from the root ("0.2.1", as in visualize.TreeView).
+# Children are compared position by position, so an inserted node shows up
+# as changes in its following siblings. Stops after limit differences.
+def diff_trees(a, b, limit=None):
+    count = 0
+    stack = [(a, b, "0")]
+    while stack:
+        left, right, path = stack.pop()
+        problems = []
+        if left.kind is not right.kind:
+            problems.append(f"{_describe(left)} became {_describe(right)}")
+        elif left.kind is NodeKind.ELEMENT:
+            if left.tag != right.tag:
+                problems.append(f"<{left.tag}> became <{right.tag}>")
+            if left.attrs != right.attrs:
+                problems.append(f"attributes of <{left.tag}> changed from {dict(left.attrs)} to {dict(right.attrs)}")
+        elif left.data != right.data:
+            problems.append(f"{_describe(left)} became {_describe(right)}")
+        if len(left.children) != len(right.children):
+            problems.append(f"{len(left.children)} children became {len(right.children)}")
+        for message in problems:
+            yield path, message
+            count += 1
+            if limit is not None and count >= limit:
+                return
+        if left.kind is right.kind:
+            pairs = list(enumerate(zip(left.children, right.children)))
+            stack.extend((l, r, f"{path}.{i}") for i, (l, r) in reversed(pairs))
+
+
+def trees_equal(a, b):
+    return next(diff_trees(a, b, limit=1), None) is None
@@ -0,0 +1,52 @@
+# Output sink shared by CodeFormatter and HTMLFormatter.
+#
+# Formatted text is collected as a list of pieces and joined once at the end,
+# so the cost of producing the output grows with its size instead of with
+# size times nesting depth. When a target with a write() method is given (an
+# open file, sys.stdout, socket.makefile("w")), the pieces are handed over in
+# batches of roughly flush_size characters instead of being kept.
+
+class OutputSink:
+    def __init__(self, target=None, indent_size=4, flush_size=65536):
+        self.target = target
+        self.indent_size = indent_size
+        self.flush_size = flush_size
+        self._parts = []
+        self._pending = 0
+        self._indents = [""]
+
+    def indent(self, depth):
+        indents = self._indents
+        while len(indents) <= depth:
+            indents.append(" " * (len(indents) * self.indent_size))
+        return indents[depth]
+
+    def write(self, text):
+        self._parts.append(text)
+        if self.target is not None:
+            self._pending += len(text)
+            if self._pending >= self.flush_size:
+                self.flush()
+
+    def write_line(self, depth, text):
+        self.write(self.indent(depth) + text + "\n")
+
+    def drain(self):
+        # Hand back the pieces written since the last drain
+        parts = self._parts
+        self._parts = []
+        self._pending = 0
+        return parts
+
+    def flush(self):
+        if self.target is not None and self._parts:
+            self.target.write("".join(self.drain()))
+
+    def getvalue(self):
+        # With a target everything is flushed to it and nothing is kept
+        if self.target is not None:
+            self.flush()
+            return None
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
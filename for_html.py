@@ -1,157 +1,681 @@
-import tkinter as tk
+# Formatting core: imports only the standard library. The Tk GUI lives in
+# html_gui.py, and graphviz is imported when first needed.
+import codecs
+import mmap
+import os
+import sys
+import time
+from enum import Enum
 from html.parser import HTMLParser
-from tkinter import messagebox
-from graphviz import Digraph
-from PIL import Image, ImageTk
+from types import MappingProxyType
+import registry
+from emitter import OutputSink
+
+# Bump whenever a change alters the formatted output (it is part of cache keys)
+FORMATTER_VERSION = "2"
 
 # Define HTML5 void elements
 VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input",
                  "link", "meta", "param", "source", "track", "wbr"}
 
+# Reads path through a memory map and yields it decoded, chunk_size bytes at a
+# time. The incremental decoder holds back multibyte characters split across
+# two windows, so only one window is ever decoded in memory.
+def iter_file_chunks(path, chunk_size=1 << 20, encoding="utf-8", errors="strict"):
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for start in range(0, size, chunk_size):
+                    text = decoder.decode(data[start:start + chunk_size])
+                    if text:
+                        yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+class NodeKind(Enum):
+    ROOT = 0
+    ELEMENT = 1
+    TEXT = 2
+    COMMENT = 3
+    DOCTYPE = 4
+
+# Shared by every node without attributes or children. They are read-only;
+# add_child swaps in a real list on first use.
+EMPTY_ATTRS = MappingProxyType({})
+NO_CHILDREN = ()
+
 class Node:
-    def __init__(self, tag=None, attrs=None, data=None, is_comment=False, is_doctype=False):
+    __slots__ = ("kind", "tag", "attrs", "data", "children")
+
+    def __init__(self, tag=None, attrs=None, data=None, is_comment=False, is_doctype=False, kind=None):
+        if kind is None:
+            if is_comment:
+                kind = NodeKind.COMMENT
+            elif is_doctype:
+                kind = NodeKind.DOCTYPE
+            elif tag == "__ROOT__":
+                kind = NodeKind.ROOT
+            elif tag is None:
+                kind = NodeKind.TEXT
+            else:
+                kind = NodeKind.ELEMENT
+        self.kind = kind
         self.tag = tag
-        self.attrs = attrs if attrs is not None else {}
+        self.attrs = attrs if attrs else EMPTY_ATTRS
         self.data = data
-        self.children = []
-        self.is_comment = is_comment
-        self.is_doctype = is_doctype
+        self.children = NO_CHILDREN
+
+    @property
+    def is_comment(self):
+        return self.kind is NodeKind.COMMENT
+
+    @property
+    def is_doctype(self):
+        return self.kind is NodeKind.DOCTYPE
 
     def add_child(self, node):
-        self.children.append(node)
+        if self.children is NO_CHILDREN:
+            self.children = [node]
+        else:
+            self.children.append(node)
+
+# Text node that keeps its text as a span of the source document and only
+# cuts the string out when data is read, so a parsed page does not hold a
+# second copy of all its text. Assigning data replaces the span.
+class SourceText(Node):
+    __slots__ = ("source", "start", "end")
+
+    def __init__(self, source, start, end):
+        self.kind = NodeKind.TEXT
+        self.tag = None
+        self.attrs = EMPTY_ATTRS
+        self.children = NO_CHILDREN
+        self.source = source
+        self.start = start
+        self.end = end
+
+    @property
+    def data(self):
+        return self.source[self.start:self.end]
+
+    @data.setter
+    def data(self, value):
+        self.source, self.start, self.end = value, 0, len(value)
+
+# With index=True, elements are also entered into a dom.DOMIndex (self.index)
+# as they are parsed, for select() queries on the finished tree.
+#
+# Pages repeat the same few tag names, attribute names and values (and whole
+# attribute sets, class="service-item" and the like) thousands of times, so
+# names are interned, values are shared through self._strings and elements
+# with identical attributes share one read-only mapping. The tables behind
+# that only pay off when lookups hit, so each is dropped (and its kind of
+# sharing switched off for the rest of the document) once fewer than
+# SHARE_MIN_HIT_RATE of its lookups have hit, checked every SHARE_CHECK
+# elements; unique ids and hrefs then cost no more than plain dicts. Both
+# tables are freed by close(). When the whole
+# document is passed as source (it must then be fed exactly that text), text
+# nodes are SourceText spans into it instead of copies.
+SHARE_CHECK = 4096
+SHARE_MIN_HIT_RATE = 0.3
 
 class HTMLTreeBuilder(HTMLParser):
-    def __init__(self):
+    def __init__(self, index=False, source=None):
         super().__init__()
-        self.root = Node(tag="__ROOT__")
+        self.root = Node(tag="__ROOT__", kind=NodeKind.ROOT)
         self.stack = [self.root]
+        self.index = None
+        if index:
+            from dom import DOMIndex
+            self.index = DOMIndex()
+            self.index.root = self.root
         self.errors = []
+        self.source = source
+        # Text found so far in source ends before _cursor; _line and
+        # _line_start track getpos() through it (see _source_offset)
+        self._cursor = 0
+        self._line = 1
+        self._line_start = 0
+        self._strings = {}
+        self._attr_sets = {}
+        # Lookups and hits in each table, for _check_sharing
+        self._string_lookups = self._string_hits = 0
+        self._set_lookups = self._set_hits = 0
+        # Text can reach handle_data in several pieces when the input is fed
+        # in chunks, so it is collected here until the next markup event
+        self._text = []
+
+    def _flush_text(self):
+        if self._text:
+            data = "".join(self._text) if len(self._text) > 1 else self._text[0]
+            self._text = []
+            stripped = data.strip()
+            if stripped:
+                self.add_text(stripped)
+
+    def _source_offset(self):
+        # getpos() as an index into source, counting lines from the last call
+        lineno, column = self.getpos()
+        while self._line < lineno:
+            self._line_start = self.source.index("\n", self._line_start) + 1
+            self._line += 1
+        return self._line_start + column
+
+    def add_text(self, data):
+        # The text lies between the previous text and the markup being
+        # handled now. Character references were unescaped in data, so when
+        # the source spells one out data is not found there and is kept as a
+        # string; any occurrence of the same characters would do otherwise.
+        start = -1
+        if self.source is not None:
+            end = self._source_offset()
+            start = self.source.find(data, self._cursor, end)
+            self._cursor = end
+        if start >= 0:
+            node = SourceText(self.source, start, start + len(data))
+        else:
+            node = Node(data=data, kind=NodeKind.TEXT)
+        self.stack[-1].add_child(node)
+
+    def _attributes(self, attrs):
+        if not attrs:
+            return EMPTY_ATTRS
+        strings = self._strings
+        key = []
+        for name, value in attrs:
+            key.append(sys.intern(name))
+            if strings is not None and value is not None:
+                shared = strings.setdefault(value, value)
+                self._string_lookups += 1
+                self._string_hits += shared is not value
+                value = shared
+            key.append(value)
+        sets = self._attr_sets
+        if sets is None:
+            return dict(zip(key[::2], key[1::2]))
+        key = tuple(key)
+        mapping = sets.get(key)
+        if mapping is None:
+            mapping = sets[key] = MappingProxyType(dict(zip(key[::2], key[1::2])))
+        else:
+            self._set_hits += 1
+        self._set_lookups += 1
+        if self._set_lookups % SHARE_CHECK == 0:
+            self._check_sharing()
+        return mapping
+
+    def _check_sharing(self):
+        if self._strings is not None and self._string_hits < self._string_lookups * SHARE_MIN_HIT_RATE:
+            self._strings = None
+        if self._set_hits < self._set_lookups * SHARE_MIN_HIT_RATE:
+            self._attr_sets = None
 
     def handle_decl(self, decl):
-        node = Node(is_doctype=True, data=decl.upper())
+        self._flush_text()
+        node = Node(data=decl.upper(), kind=NodeKind.DOCTYPE)
         self.stack[-1].add_child(node)
 
     def handle_starttag(self, tag, attrs):
-        if tag.lower() in VOID_ELEMENTS:
-            node = Node(tag=tag, attrs=dict(attrs))
-            self.stack[-1].add_child(node)
-        else:
-            node = Node(tag=tag, attrs=dict(attrs))
-            self.stack[-1].add_child(node)
+        self._flush_text()
+        node = Node(tag=sys.intern(tag), attrs=self._attributes(attrs), kind=NodeKind.ELEMENT)
+        self.stack[-1].add_child(node)
+        if self.index is not None:
+            self.index.add(node, self.stack[-1])
+        if tag.lower() not in VOID_ELEMENTS:
             self.stack.append(node)
 
     def handle_endtag(self, tag):
+        self._flush_text()
         if tag.lower() not in VOID_ELEMENTS and len(self.stack) > 1:
             if self.stack[-1].tag == tag:
                 self.stack.pop()
 
     def handle_data(self, data):
-        stripped = data.strip()
-        if stripped:
-            node = Node(data=stripped)
-            self.stack[-1].add_child(node)
+        self._text.append(data)
 
     def handle_comment(self, data):
-        node = Node(data=data.strip(), is_comment=True)
+        self._flush_text()
+        node = Node(data=data.strip(), kind=NodeKind.COMMENT)
         self.stack[-1].add_child(node)
 
+    # Processing instructions and CDATA sections are dropped, but still
+    # separate the text before them from the text after them
+    def handle_pi(self, data):
+        self._flush_text()
+
+    def unknown_decl(self, data):
+        self._flush_text()
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        self._strings = self._attr_sets = None
+
     def get_tree(self):
         return self.root
 
+# Parser that turns events straight into formatted lines. Only the tags of the
+# currently open elements are kept, so memory depends on nesting depth rather
+# than on document size. The contents of <style> and <script> blocks are
+# handed to their registry formatter one at a time as each block ends (see
+# HTMLFormatter.format_block).
+class HTMLStreamBuilder(HTMLTreeBuilder):
+    def __init__(self, formatter):
+        super().__init__()
+        self.formatter = formatter
+        self.stack = ["__ROOT__"]
+        # Registry formatter for the text of each open element, if it has one
+        self.blocks = [None]
+        self.out = OutputSink(indent_size=formatter.indent_size)
+
+    def take_lines(self):
+        return self.out.drain()
+
+    def add_text(self, data):
+        depth = len(self.stack) - 1
+        if self.blocks[-1] is not None:
+            data = self.formatter.format_block(self.blocks[-1], data, depth)
+        self.out.write_line(depth, data)
+
+    def handle_decl(self, decl):
+        self._flush_text()
+        self.out.write(f"<!{decl.upper()}>\n")
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        attrs = dict(attrs)
+        self.out.write_line(len(self.stack) - 1, self.formatter.start_tag(tag, attrs))
+        if tag.lower() not in VOID_ELEMENTS:
+            self.stack.append(tag)
+            kind = _embedded_type(tag, attrs)
+            self.blocks.append(registry.for_mime_type(kind) if kind else None)
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if tag.lower() not in VOID_ELEMENTS and len(self.stack) > 1:
+            if self.stack[-1] == tag:
+                self.stack.pop()
+                self.blocks.pop()
+                self.out.write_line(len(self.stack) - 1, f"</{tag}>")
+
+    def handle_comment(self, data):
+        self._flush_text()
+        self.out.write_line(len(self.stack) - 1, f"<!-- {data.strip()} -->")
+
+    def close(self):
+        super().close()
+        # Elements left open at the end of input are closed, as format_node does
+        while len(self.stack) > 1:
+            tag = self.stack.pop()
+            self.out.write_line(len(self.stack) - 1, f"</{tag}>")
+
+# Tree builder that also records where each element, doctype and comment
+# starts in source (starts) and where the end tag of each element that was
+# closed starts (ends), as offsets into source. Text nodes are not recorded:
+# their position is only known once the following markup has been seen.
+class HTMLRegionBuilder(HTMLTreeBuilder):
+    def __init__(self, source):
+        super().__init__(source=source)
+        self.starts = {}
+        self.ends = {}
+
+    def _record(self, parent, start):
+        self.starts[parent.children[-1]] = start
+
+    def handle_decl(self, decl):
+        self._flush_text()
+        parent, start = self.stack[-1], self._source_offset()
+        super().handle_decl(decl)
+        self._record(parent, start)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        parent, start = self.stack[-1], self._source_offset()
+        super().handle_starttag(tag, attrs)
+        self._record(parent, start)
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        node, end = self.stack[-1], self._source_offset()
+        super().handle_endtag(tag)
+        if self.stack[-1] is not node:
+            self.ends[node] = end
+
+    def handle_comment(self, data):
+        self._flush_text()
+        parent, start = self.stack[-1], self._source_offset()
+        super().handle_comment(data)
+        self._record(parent, start)
+
+# The content type of a <style> or <script> element, for looking up its
+# formatter in the registry; None for other elements
+def embedded_type(node):
+    return _embedded_type(node.tag, node.attrs)
+
+def _embedded_type(tag, attrs):
+    tag = tag.lower()
+    if tag == "style":
+        return (attrs.get("type") or "text/css").strip().lower()
+    if tag == "script":
+        kind = (attrs.get("type") or "text/javascript").strip().lower()
+        return "text/javascript" if kind == "module" else kind
+    return None
+
 class HTMLFormatter:
-    def __init__(self, indent_size=4):
+    # stats takes an instrument.FormatterStats to profile the formatter.
+    # workers is passed on to registry.format_many for embedded blocks.
+    def __init__(self, indent_size=4, stats=None, workers=None):
         self.indent_size = indent_size
+        self.stats = stats
+        self.workers = workers
 
-    def format_html(self, code):
-        parser = HTMLTreeBuilder()
+    # When out is given (anything with a write() method) the formatted HTML is
+    # written to it as it is produced and None is returned
+    def format_html(self, code, out=None):
+        if self.stats is not None:
+            return self._format_html_timed(code, out)
+        parser = HTMLTreeBuilder(source=code)
         parser.feed(code)
         parser.close()
         tree = parser.get_tree()
-        return self.format_node(tree, 0)
+        self.format_embedded(tree.children)
+        sink = OutputSink(out, indent_size=self.indent_size)
+        self.write_node(tree, 0, sink)
+        return sink.getvalue()
 
-    def format_node(self, node, depth):
-        if node.tag == "__ROOT__":
-            result = ""
-            for child in node.children:
-                result += self.format_node(child, depth)
-            return result
-
-        indent = " " * (depth * self.indent_size)
-        if node.is_doctype:
-            return f"<!{node.data}>\n"
-        if node.is_comment:
-            return indent + f"<!-- {node.data} -->\n"
-        if node.tag is None and node.data:
-            return indent + node.data + "\n"
-
-        attrs_str = " ".join(f'{k}="{v}"' for k, v in node.attrs.items())
-        start_tag = f"<{node.tag} {attrs_str}".strip() + ">"
-        if node.tag.lower() in VOID_ELEMENTS:
-            return indent + start_tag + "\n"
-
-        result = indent + start_tag + "\n"
-        for child in node.children:
-            result += self.format_node(child, depth + 1)
-        result += indent + f"</{node.tag}>\n"
+    def _format_html_timed(self, code, out):
+        stats = self.stats
+        stats.add_input(code)
+        parser = stats.time_callbacks(HTMLTreeBuilder(source=code))
+        with stats.stage("html.feed"):
+            parser.feed(code)
+            parser.close()
+        with stats.stage("html.embedded"):
+            self.format_embedded(parser.get_tree().children)
+        sink = OutputSink(stats.wrap_output(out), indent_size=self.indent_size)
+        with stats.stage("html.write"):
+            self.write_node(parser.get_tree(), 0, sink)
+        result = sink.getvalue()
+        stats.add_output(result)
         return result
 
-    def visualize_html_tree(self, tree):
-        graph = Digraph(format="png")
-        self.add_nodes(graph, tree, "root")
-        return graph
-
-    def add_nodes(self, graph, node, parent_name):
-        node_id = str(id(node))
-        label = node.tag if node.tag else (node.data if node.data else "Text")
-        graph.node(node_id, label)
-        if parent_name != "root":
-            graph.edge(parent_name, node_id)
-        for child in node.children:
-            self.add_nodes(graph, child, node_id)
-
-class FormatterGUI:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("HTML Formatter with Visualization")
-
-        self.input_label = tk.Label(root, text="Unformatted HTML:")
-        self.input_label.pack()
-
-        self.input_text = tk.Text(root, height=10, width=80)
-        self.input_text.pack()
-
-        self.format_button = tk.Button(root, text="Format Code", command=self.format_code)
-        self.format_button.pack()
-
-        self.visualize_button = tk.Button(root, text="Visualize LL Parsing", command=self.visualize_html)
-        self.visualize_button.pack()
-
-        self.output_label = tk.Label(root, text="Formatted HTML:")
-        self.output_label.pack()
-
-        self.output_text = tk.Text(root, height=10, width=80)
-        self.output_text.pack()
-
-    def format_code(self):
-        code = self.input_text.get("1.0", tk.END)
-        formatter = HTMLFormatter()
-        formatted_code = formatter.format_html(code)
-        self.output_text.delete("1.0", tk.END)
-        self.output_text.insert(tk.END, formatted_code)
-
-    def visualize_html(self):
-        code = self.input_text.get("1.0", tk.END)
-        formatter = HTMLFormatter()
-        parser = HTMLTreeBuilder()
+    # Formats an HTML file without reading it into memory first (see
+    # iter_file_chunks). Tags split across windows are completed by
+    # HTMLParser's own buffering and text by HTMLTreeBuilder's. With
+    # stream=True no tree is built either (see format_html_stream), so memory
+    # stays bounded by nesting depth even for multi-gigabyte files.
+    def format_html_file(self, path, out=None, stream=False, chunk_size=1 << 20, encoding="utf-8"):
+        chunks = iter_file_chunks(path, chunk_size, encoding)
+        sink = OutputSink(out, indent_size=self.indent_size)
+        if stream:
+            for line in self.format_html_stream(chunks):
+                sink.write(line)
+        else:
+            parser = HTMLTreeBuilder()
+            for chunk in chunks:
+                parser.feed(chunk)
+            parser.close()
+            self.format_embedded(parser.get_tree().children)
+            self.write_node(parser.get_tree(), 0, sink)
+        return sink.getvalue()
+
+    def format_html_stream(self, source, chunk_size=65536):
+        # source is a file object or an iterable of text chunks; lines are
+        # yielded as soon as the parser has seen enough input to produce them
+        if hasattr(source, "read"):
+            reader = source
+            source = iter(lambda: reader.read(chunk_size), "")
+        parser = HTMLStreamBuilder(self)
+        for chunk in source:
+            parser.feed(chunk)
+            yield from parser.take_lines()
+        parser.close()
+        yield from parser.take_lines()
+
+    # Hands the contents of <style> and <script> blocks under nodes (written
+    # at depth) to the registry formatter for their type, all of them in one
+    # batch, and replaces the text with the result, indented to fit. Blocks
+    # without a formatter, or that fail to format, are left as they are.
+    def format_embedded(self, nodes, depth=0):
+        if not registry.has_mime_types():
+            return
+        blocks = []
+        stack = [(node, depth) for node in nodes]
+        while stack:
+            node, depth = stack.pop()
+            if node.kind is not NodeKind.ELEMENT:
+                continue
+            kind = embedded_type(node)
+            formatter = registry.for_mime_type(kind) if kind else None
+            if formatter is not None:
+                blocks.extend((child, depth + 1, formatter) for child in node.children
+                              if child.kind is NodeKind.TEXT)
+            else:
+                stack.extend((child, depth + 1) for child in node.children)
+        if not blocks:
+            return
+        results = registry.format_many(((formatter.name, _dedent_block(node.data), self.indent_size)
+                                        for node, depth, formatter in blocks), self.workers)
+        for (node, depth, formatter), result in zip(blocks, results):
+            text = self._indent_block(result, depth)
+            if text is not None:
+                node.data = text
+
+    # format_embedded for a single block, in this process: returns text, the
+    # contents of a <style> or <script> element, formatted by formatter and
+    # indented to be written at depth
+    def format_block(self, formatter, text, depth):
+        try:
+            result = formatter.format(_dedent_block(text), self.indent_size)
+        except Exception:
+            return text
+        return self._indent_block(result, depth) or text
+
+    # Returns result indented to be written at depth, or None if formatting
+    # failed or left nothing
+    def _indent_block(self, result, depth):
+        if not isinstance(result, str) or not result.strip():
+            return None
+        prefix = " " * (depth * self.indent_size)
+        lines = result.strip("\n").split("\n")
+        return "\n".join(lines[:1] + [prefix + line if line.strip() else "" for line in lines[1:]])
+
+    def start_tag(self, tag, attrs):
+        attrs_str = " ".join(f'{k}="{v}"' for k, v in attrs.items())
+        return f"<{tag} {attrs_str}".strip() + ">"
+
+    def format_node(self, node, depth):
+        sink = OutputSink(indent_size=self.indent_size)
+        self.write_node(node, depth, sink)
+        return sink.getvalue()
+
+    # Walks the tree with an explicit stack, so deeply nested documents do
+    # not hit the recursion limit. Closing tags are pushed as plain strings.
+    def write_node(self, node, depth, out):
+        if self.stats is not None:
+            return self._write_node_timed(node, depth, out)
+        stack = [(node, depth)]
+        while stack:
+            node, depth = stack.pop()
+            if node.__class__ is str:
+                out.write_line(depth, node)
+                continue
+            kind = node.kind
+            if kind is NodeKind.ROOT:
+                stack.extend((child, depth) for child in reversed(node.children))
+            elif kind is NodeKind.TEXT:
+                out.write_line(depth, node.data)
+            elif kind is NodeKind.DOCTYPE:
+                out.write(f"<!{node.data}>\n")
+            elif kind is NodeKind.COMMENT:
+                out.write_line(depth, f"<!-- {node.data} -->")
+            elif node.tag.lower() in VOID_ELEMENTS:
+                out.write_line(depth, self.start_tag(node.tag, node.attrs))
+            else:
+                out.write_line(depth, self.start_tag(node.tag, node.attrs))
+                stack.append((f"</{node.tag}>", depth))
+                stack.extend((child, depth + 1) for child in reversed(node.children))
+
+    # write_node() with each node's lines timed and charged to its tag name
+    # (#text, #comment, ... for the other kinds); closing tags count as their
+    # element's
+    def _write_node_timed(self, node, depth, out):
+        clock = time.perf_counter
+        add_node = self.stats.add_node
+        stack = [(node, depth)]
+        while stack:
+            node, depth = stack.pop()
+            start = clock()
+            if node.__class__ is str:
+                out.write_line(depth, node)
+                add_node(node[2:-1], clock() - start, 0)
+                continue
+            kind = node.kind
+            if kind is NodeKind.ELEMENT:
+                out.write_line(depth, self.start_tag(node.tag, node.attrs))
+                if node.tag.lower() not in VOID_ELEMENTS:
+                    stack.append((f"</{node.tag}>", depth))
+                    stack.extend((child, depth + 1) for child in reversed(node.children))
+                add_node(node.tag, clock() - start)
+                continue
+            if kind is NodeKind.ROOT:
+                stack.extend((child, depth) for child in reversed(node.children))
+            elif kind is NodeKind.TEXT:
+                out.write_line(depth, node.data)
+            elif kind is NodeKind.DOCTYPE:
+                out.write(f"<!{node.data}>\n")
+            elif kind is NodeKind.COMMENT:
+                out.write_line(depth, f"<!-- {node.data} -->")
+            add_node("#" + kind.name.lower(), clock() - start)
+
+    # Returns a visualize.TreeView; see there for how large trees are cut down
+    def visualize_html_tree(self, tree, max_depth=6, max_nodes=300):
+        from visualize import TreeView
+        return TreeView(tree, lambda node: node.children,
+                        lambda node: node.tag if node.tag else (node.data if node.data else "Text"),
+                        max_depth, max_nodes, self.stats)
+
+# Text nodes are stripped, so the first line of a block has lost the
+# indentation the other lines still have. It is given the smallest indentation
+# of the rest before the block is dedented as a whole.
+def _dedent_block(text):
+    import textwrap
+    rest = [line for line in text.split("\n")[1:] if line.strip()]
+    indent = min((len(line) - len(line.lstrip()) for line in rest), default=0)
+    return textwrap.dedent(" " * indent + text) + "\n"
+
+def _element_count(nodes):
+    return sum(node.kind is NodeKind.ELEMENT for node in nodes)
+
+# Tags that are always split into their children, and the source size above
+# which other elements are (see IncrementalHTMLFormatter._split)
+CONTAINER_TAGS = {"html", "head", "body"}
+SPLIT_SIZE = 1024
+
+# Formatter for repeated calls on the same, slowly changing document (format
+# as you type). The output is cut into regions: one per child of <html>,
+# <head> and <body>, of any element that is the only element among its
+# siblings (a page-wide <div id="app">) and of any element with more than
+# SPLIT_SIZE characters of source, with those elements' own tags as regions
+# of their own; one per top-level node otherwise. Each region is
+# keyed by its depth and the source between its start and the start of the
+# next sibling (text nodes by their text), and only regions whose key is new
+# since the previous update are formatted again.
+class IncrementalHTMLFormatter:
+    def __init__(self, formatter=None):
+        self.formatter = formatter if formatter is not None else HTMLFormatter()
+        self.cache = {}
+        self.reformatted = 0
+
+    def _split(self, node, key, sole):
+        if node.kind is not NodeKind.ELEMENT or node.tag.lower() in VOID_ELEMENTS:
+            return False
+        if not any(child.kind is NodeKind.ELEMENT for child in node.children):
+            return False
+        if node.tag.lower() in CONTAINER_TAGS or len(key[1]) > SPLIT_SIZE:
+            return True
+        return sole
+
+    # (node, key, end) for each of nodes, where end is where the node's
+    # source ends
+    def _keys(self, code, starts, nodes, depth, end):
+        entries = [None] * len(nodes)
+        for i in range(len(nodes) - 1, -1, -1):
+            start = starts.get(nodes[i])
+            if start is None:
+                entries[i] = (nodes[i], ("text", depth, nodes[i].data), end)
+            else:
+                entries[i] = (nodes[i], (depth, code[start:end]), end)
+                end = start
+        return entries
+
+    # Returns the formatted HTML as a list of regions
+    def update(self, code):
+        parser = HTMLRegionBuilder(code)
         parser.feed(code)
-        tree = parser.get_tree()
-        graph = formatter.visualize_html_tree(tree)
-        graph.render('html_tree', format='png', cleanup=False)
-        img = Image.open('html_tree.png')
-        img = img.resize((600, 400))
-        img = ImageTk.PhotoImage(img)
+        parser.close()
+        root = parser.get_tree()
+
+        # (key, node, depth) for the regions to format, in output order; tag
+        # lines of split elements are plain strings
+        items = []
+        indent = " " * self.formatter.indent_size
+        stack = [(iter(self._keys(code, parser.starts, root.children, 0, len(code))),
+                  _element_count(root.children) == 1, 0)]
+        while stack:
+            entries, sole, depth = stack[-1]
+            entry = next(entries, None)
+            if entry is None:
+                stack.pop()
+                continue
+            if entry.__class__ is str:
+                items.append(entry)
+                continue
+            node, key, end = entry
+            if self._split(node, key, sole):
+                items.append(indent * depth + self.formatter.start_tag(node.tag, node.attrs) + "\n")
+                children = self._keys(code, parser.starts, node.children, depth + 1, parser.ends.get(node, end))
+                children.append(f"{indent * depth}</{node.tag}>\n")
+                stack.append((iter(children), _element_count(node.children) == 1, depth + 1))
+            else:
+                items.append((key, node, depth))
+
+        # Embedded blocks of the regions about to be formatted go out in one
+        # batch per depth
+        pending = {}
+        for item in items:
+            if item.__class__ is not str and item[0] not in self.cache:
+                pending.setdefault(item[2], []).append(item[1])
+        for depth, nodes in pending.items():
+            self.formatter.format_embedded(nodes, depth)
+
+        cache = {}
+        regions = []
+        self.reformatted = 0
+        for item in items:
+            if item.__class__ is str:
+                regions.append(item)
+                continue
+            key, node, depth = item
+            text = cache.get(key) or self.cache.get(key)
+            if text is None:
+                text = self.formatter.format_node(node, depth)
+                self.reformatted += 1
+            cache[key] = text
+            regions.append(text)
+        self.cache = cache
+        return regions
+
+# The GUI is only loaded when asked for
+def __getattr__(name):
+    if name == "FormatterGUI":
+        from html_gui import FormatterGUI
+        return FormatterGUI
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = FormatterGUI(root)
-    root.mainloop()
+    from html_gui import main
+    main()
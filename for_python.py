@@ -1,203 +1,390 @@
-import tkinter as tk
-from tkinter import messagebox
+# Formatting core: imports only the standard library. The Tk GUI lives in
+# python_gui.py, and tkinter/graphviz are imported when first needed.
 import ast
-import networkx as nx
-from graphviz import Digraph
-from PIL import Image, ImageTk
+import collections
+import io
+import os
+import sys
+import time
+import token
+from emitter import OutputSink
 
 
+# Bump whenever a change alters the formatted output (it is part of cache keys)
+FORMATTER_VERSION = "2"
+
+OPERATORS = {
+    ast.Add: '+',
+    ast.Sub: '-',
+    ast.Mult: '*',
+    ast.MatMult: '@',
+    ast.Div: '/',
+    ast.Mod: '%',
+    ast.Pow: '**',
+    ast.LShift: '<<',
+    ast.RShift: '>>',
+    ast.BitOr: '|',
+    ast.BitXor: '^',
+    ast.BitAnd: '&',
+    ast.FloorDiv: '//',
+    ast.And: 'and',
+    ast.Or: 'or',
+    ast.Invert: '~',
+    ast.Not: 'not ',
+    ast.UAdd: '+',
+    ast.USub: '-',
+    ast.Eq: '==',
+    ast.NotEq: '!=',
+    ast.Lt: '<',
+    ast.LtE: '<=',
+    ast.Gt: '>',
+    ast.GtE: '>=',
+    ast.Is: 'is',
+    ast.IsNot: 'is not',
+    ast.In: 'in',
+    ast.NotIn: 'not in',
+}
+
+# Child interpreter used to run user code when execution is requested. It
+# sets the memory cap (argv[1], 0 for none) itself: subprocess's preexec_fn
+# is not safe while other threads run, as they do under the GUI's
+# BackgroundRunner.
+_RUNNER = """\
+import sys
+limit = int(sys.argv[1])
+if limit:
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass
+exec(compile(sys.stdin.read(), '<user-input>', 'exec'), {})
+"""
+
+def run_code_isolated(code, timeout=5.0, memory_limit=256 * 1024 * 1024):
+    # Runs code in a separate interpreter with a wall-clock timeout and, on
+    # POSIX, a cap on its address space. Raises RuntimeError with the child's
+    # error if it fails or does not finish in time.
+    import subprocess
+
+    try:
+        result = subprocess.run([sys.executable, "-I", "-c", _RUNNER, str(memory_limit or 0)], input=code,
+                                capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"Code did not finish within {timeout} seconds")
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"Code exited with status {result.returncode}")
+
 # Formatter class
 class CodeFormatter:
-    def __init__(self):
+    # Formatting only parses the code. With execute=True the code is also run
+    # in a subprocess (see run_code_isolated) and is left unformatted if that fails.
+    # stats takes an instrument.FormatterStats to profile the formatter.
+    def __init__(self, execute=False, exec_timeout=5.0, exec_memory_limit=256 * 1024 * 1024, stats=None):
         self.indent_size = 4
-        self.formatted_code = ''
+        self.execute = execute
+        self.exec_timeout = exec_timeout
+        self.exec_memory_limit = exec_memory_limit
+        self.stats = stats
+        self.out = OutputSink(indent_size=self.indent_size)
         self.current_indent = 0
-    def format_code(self, code):
-        try:
-            # 1) Parse code into AST (this catches SyntaxError)
-            tree = ast.parse(code)
-            
-            # 2) If parsing is successful, you can optionally run the code here:
-            compiled_code = compile(tree, filename="<user-input>", mode="exec")
-            exec(compiled_code, {})
-            
-            # If the code runs successfully, format it
-            self.formatted_code = ''
-            self.current_indent = 0
-            self.visit(tree)
-            return self.formatted_code
 
+    @property
+    def formatted_code(self):
+        return self.out.getvalue()
+
+    # When out is given (anything with a write() method) the formatted code is
+    # written to it as it is produced and None is returned
+    def format_code(self, code, out=None):
+        try:
+            return self.format_source(code, out)
         except SyntaxError as e:
+            from tkinter import messagebox
             messagebox.showerror("Syntax Error", f"{e}")
             return code
         except Exception as e:
-            # This will catch NameError, TypeError, etc. during runtime
+            # This will catch errors raised while running the code (execute=True)
+            from tkinter import messagebox
             messagebox.showerror("Runtime Error", str(e))
             return code
 
+    # Same as format_code, but errors are raised instead of shown in a dialog
+    def format_source(self, code, out=None):
+        if self.stats is not None:
+            return self._format_source_timed(code, out)
+
+        # 1) Parse code into AST (this raises SyntaxError)
+        tree = ast.parse(code)
+
+        # 2) Optionally run the code, isolated from this process
+        if self.execute:
+            run_code_isolated(code, self.exec_timeout, self.exec_memory_limit)
+
+        # 3) Format it
+        self.out = OutputSink(out, indent_size=self.indent_size)
+        self.current_indent = 0
+        self.visit(tree)
+        return self.out.getvalue()
+
+    def _format_source_timed(self, code, out):
+        stats = self.stats
+        stats.add_input(code)
+        with stats.stage("python.parse"):
+            tree = ast.parse(code)
+        if self.execute:
+            with stats.stage("python.exec"):
+                run_code_isolated(code, self.exec_timeout, self.exec_memory_limit)
+        self.out = OutputSink(stats.wrap_output(out), indent_size=self.indent_size)
+        self.current_indent = 0
+        with stats.stage("python.visit"):
+            self.visit(tree)
+        result = self.out.getvalue()
+        stats.add_output(result)
+        return result
+
+    # Formats a large module on a process pool and gives the same result as
+    # format_source. Top-level statements are formatted independently, so the
+    # module is cut into about chunks_per_worker chunks per worker at lines
+    # that look like the start of one (see _split_lines), and the workers'
+    # parse of their chunks is the only one. A cut inside a statement leaves
+    # the chunk before it unfinished, so that chunk fails to parse: from the
+    # first chunk that fails, the rest of the module is formatted here, which
+    # also gives a real syntax error its line number in the whole module.
+    # Modules under min_lines lines are formatted in this process.
+    def format_source_parallel(self, code, out=None, workers=None, min_lines=5000, chunks_per_worker=4):
+        workers = workers or os.cpu_count() or 1
+        # Split like the tokenizer does (\n, \r\n, \r) so line numbers match
+        lines = io.StringIO(code, newline="").readlines()
+        starts = _split_lines(lines, max(len(lines) // (workers * chunks_per_worker), 1))
+        if len(lines) < min_lines or workers == 1 or len(starts) < 2:
+            return self.format_source(code, out)
+        segments = ["".join(lines[start:end]) for start, end in zip(starts, starts[1:] + [len(lines)])]
+
+        from concurrent.futures import ProcessPoolExecutor
+        texts = []
+        failed = None
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_format_segment, segment, self.indent_size) for segment in segments]
+            for i, future in enumerate(futures):
+                try:
+                    texts.append(future.result())
+                except SyntaxError as e:
+                    if i == len(segments) - 1:
+                        raise _shift_lines(e, starts[i])
+                    failed = i
+                    for rest in futures[i + 1:]:
+                        rest.cancel()
+                    break
+        if failed is not None:
+            try:
+                texts.append(_format_segment("".join(segments[failed:]), self.indent_size))
+            except SyntaxError as e:
+                raise _shift_lines(e, starts[failed])
+
+        if self.execute:
+            run_code_isolated(code, self.exec_timeout, self.exec_memory_limit)
+        self.out = OutputSink(out, indent_size=self.indent_size)
+        self.current_indent = 0
+        for text in texts:
+            self.out.write(text)
+        return self.out.getvalue()
+
+    # Formats a single statement at the outermost indentation level
+    def format_node(self, node):
+        self.out = OutputSink(indent_size=self.indent_size)
+        self.current_indent = 0
+        self.visit(node)
+        return self.out.getvalue()
 
+    # Visitors are generators that yield the child statements they want
+    # visited. visit() runs them from an explicit stack instead of recursing,
+    # so deeply nested code does not hit the recursion limit. A visitor that
+    # yields nothing can be a plain method.
     def visit(self, node):
         if node is None:
             return
+        if self.stats is not None:
+            return self._visit_timed(node)
+        stack = [self._visitor(node)]
+        while stack:
+            try:
+                child = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+            if child is not None:
+                stack.append(self._visitor(child))
+
+    # visit() with each visitor step timed and charged to its node's type
+    def _visit_timed(self, node):
+        clock = time.perf_counter
+        add_node = self.stats.add_node
+        start = clock()
+        stack = [(self._visitor(node), type(node).__name__)]
+        add_node(stack[-1][1], clock() - start)
+        while stack:
+            steps, name = stack[-1]
+            start = clock()
+            try:
+                child = next(steps)
+            except StopIteration:
+                stack.pop()
+                add_node(name, clock() - start, 0)
+                continue
+            add_node(name, clock() - start, 0)
+            if child is not None:
+                start = clock()
+                stack.append((self._visitor(child), type(child).__name__))
+                add_node(stack[-1][1], clock() - start)
+
+    def _visitor(self, node):
         method_name = 'visit_' + node.__class__.__name__
         visitor = getattr(self, method_name, self.generic_visit)
-        visitor(node)
+        steps = visitor(node)
+        return steps if steps is not None else iter(())
 
     def generic_visit(self, node):
         # Visit all child nodes
-        for child in ast.iter_child_nodes(node):
-            self.visit(child)
+        yield from ast.iter_child_nodes(node)
 
     def visit_Module(self, node):
-        for stmt in node.body:
-            self.visit(stmt)
+        yield from node.body
 
     def visit_ClassDef(self, node):
         # Handle decorators
         for decorator in node.decorator_list:
             self.write_indent()
             decorator_str = self.get_node_name(decorator)
-            self.formatted_code += f"@{decorator_str}\n"
+            self.out.write(f"@{decorator_str}\n")
         
         # Write class definition
         self.write_indent()
         bases = [self.get_node_name(base) for base in node.bases]
         bases_str = f"({', '.join(bases)})" if bases else ""
-        self.formatted_code += f"class {node.name}{bases_str}:\n"
+        self.out.write(f"class {node.name}{bases_str}:\n")
         self.current_indent += 1
 
         if not node.body:
             self.write_indent()
-            self.formatted_code += "pass\n"
+            self.out.write("pass\n")
         else:
-            for stmt in node.body:
-                self.visit(stmt)
+            yield from node.body
         
         self.current_indent -= 1
-        self.formatted_code += '\n'
+        self.out.write('\n')
 
     def visit_FunctionDef(self, node):
         # Handle decorators
         for decorator in node.decorator_list:
             self.write_indent()
             decorator_str = self.get_node_name(decorator)
-            self.formatted_code += f"@{decorator_str}\n"
+            self.out.write(f"@{decorator_str}\n")
 
         self.write_indent()
         args = [arg.arg for arg in node.args.args]
         args_str = ', '.join(args)
-        self.formatted_code += f"def {node.name}({args_str}):\n"
+        self.out.write(f"def {node.name}({args_str}):\n")
         self.current_indent += 1
         if not node.body:
             self.write_indent()
-            self.formatted_code += "pass\n"
+            self.out.write("pass\n")
         else:
-            for stmt in node.body:
-                self.visit(stmt)
+            yield from node.body
         self.current_indent -= 1
-        self.formatted_code += '\n'
+        self.out.write('\n')
 
     def visit_AsyncFunctionDef(self, node):
         # Handle decorators
         for decorator in node.decorator_list:
             self.write_indent()
             decorator_str = self.get_node_name(decorator)
-            self.formatted_code += f"@{decorator_str}\n"
+            self.out.write(f"@{decorator_str}\n")
 
         self.write_indent()
         args = [arg.arg for arg in node.args.args]
         args_str = ', '.join(args)
-        self.formatted_code += f"async def {node.name}({args_str}):\n"
+        self.out.write(f"async def {node.name}({args_str}):\n")
         self.current_indent += 1
         if not node.body:
             self.write_indent()
-            self.formatted_code += "pass\n"
+            self.out.write("pass\n")
         else:
-            for stmt in node.body:
-                self.visit(stmt)
+            yield from node.body
         self.current_indent -= 1
-        self.formatted_code += '\n'
+        self.out.write('\n')
 
     def visit_Return(self, node):
         self.write_indent()
-        self.formatted_code += "return"
+        self.out.write("return")
         if node.value is not None:
-            self.formatted_code += f" {self.get_node_name(node.value)}"
-        self.formatted_code += '\n'
+            self.out.write(f" {self.get_node_name(node.value)}")
+        self.out.write('\n')
 
     def visit_Raise(self, node):
         self.write_indent()
-        self.formatted_code += "raise"
+        self.out.write("raise")
         if node.exc is not None:
-            self.formatted_code += f" {self.get_node_name(node.exc)}"
+            self.out.write(f" {self.get_node_name(node.exc)}")
         if node.cause is not None:
-            self.formatted_code += f" from {self.get_node_name(node.cause)}"
-        self.formatted_code += '\n'
+            self.out.write(f" from {self.get_node_name(node.cause)}")
+        self.out.write('\n')
 
     def visit_Expr(self, node):
         self.write_indent()
         expr_str = self.get_node_name(node.value)
-        self.formatted_code += f"{expr_str}\n"
+        self.out.write(f"{expr_str}\n")
 
     def visit_Call(self, node):
-        func_name = self.get_node_name(node.func)
-        args = [self.get_node_name(arg) for arg in node.args]
-        args_str = ', '.join(args)
-        self.formatted_code += f"{func_name}({args_str})"
+        self.out.write(self.get_node_name(node))
 
     def visit_Assign(self, node):
         self.write_indent()
         targets = [self.get_node_name(t) for t in node.targets]
         value = self.get_node_name(node.value)
-        self.formatted_code += f"{' = '.join(targets)} = {value}\n"
+        self.out.write(f"{' = '.join(targets)} = {value}\n")
 
     def visit_If(self, node):
         self.write_indent()
         test = self.get_node_name(node.test)
-        self.formatted_code += f"if {test}:\n"
+        self.out.write(f"if {test}:\n")
         self.current_indent += 1
-        for stmt in node.body:
-            self.visit(stmt)
+        yield from node.body
         self.current_indent -= 1
         if node.orelse:
             self.write_indent()
-            self.formatted_code += f"else:\n"
+            self.out.write(f"else:\n")
             self.current_indent += 1
-            for stmt in node.orelse:
-                self.visit(stmt)
+            yield from node.orelse
             self.current_indent -= 1
 
     def visit_For(self, node):
         self.write_indent()
         target = self.get_node_name(node.target)
         iter_ = self.get_node_name(node.iter)
-        self.formatted_code += f"for {target} in {iter_}:\n"
+        self.out.write(f"for {target} in {iter_}:\n")
         self.current_indent += 1
-        for stmt in node.body:
-            self.visit(stmt)
+        yield from node.body
         self.current_indent -= 1
         if node.orelse:
             self.write_indent()
-            self.formatted_code += f"else:\n"
+            self.out.write(f"else:\n")
             self.current_indent += 1
-            for stmt in node.orelse:
-                self.visit(stmt)
+            yield from node.orelse
             self.current_indent -= 1
 
     def visit_While(self, node):
         self.write_indent()
         test = self.get_node_name(node.test)
-        self.formatted_code += f"while {test}:\n"
+        self.out.write(f"while {test}:\n")
         self.current_indent += 1
-        for stmt in node.body:
-            self.visit(stmt)
+        yield from node.body
         self.current_indent -= 1
         if node.orelse:
             self.write_indent()
-            self.formatted_code += f"else:\n"
+            self.out.write(f"else:\n")
             self.current_indent += 1
-            for stmt in node.orelse:
-                self.visit(stmt)
+            yield from node.orelse
             self.current_indent -= 1
 
     def visit_AugAssign(self, node):
@@ -205,37 +392,36 @@ class CodeFormatter:
         target = self.get_node_name(node.target)
         op = self.get_operator(node.op)
         value = self.get_node_name(node.value)
-        self.formatted_code += f"{target} {op}= {value}\n"
+        self.out.write(f"{target} {op}= {value}\n")
 
     def visit_Import(self, node):
         self.write_indent()
         names = [alias.name if alias.asname is None else f"{alias.name} as {alias.asname}" for alias in node.names]
-        self.formatted_code += f"import {', '.join(names)}\n"
+        self.out.write(f"import {', '.join(names)}\n")
 
     def visit_ImportFrom(self, node):
         self.write_indent()
         module = node.module if node.module else ""
         names = [alias.name if alias.asname is None else f"{alias.name} as {alias.asname}" for alias in node.names]
-        self.formatted_code += f"from {module} import {', '.join(names)}\n"
+        self.out.write(f"from {module} import {', '.join(names)}\n")
 
     def visit_Pass(self, node):
         self.write_indent()
-        self.formatted_code += "pass\n"
+        self.out.write("pass\n")
 
     def visit_Break(self, node):
         self.write_indent()
-        self.formatted_code += "break\n"
+        self.out.write("break\n")
 
     def visit_Continue(self, node):
         self.write_indent()
-        self.formatted_code += "continue\n"
+        self.out.write("continue\n")
 
     def visit_Try(self, node):
         self.write_indent()
-        self.formatted_code += "try:\n"
+        self.out.write("try:\n")
         self.current_indent += 1
-        for stmt in node.body:
-            self.visit(stmt)
+        yield from node.body
         self.current_indent -= 1
         for handler in node.handlers:
             self.write_indent()
@@ -245,222 +431,635 @@ class CodeFormatter:
                     name_str = f" as {handler.name}"
                 else:
                     name_str = ""
-                self.formatted_code += f"except {type_str}{name_str}:\n"
+                self.out.write(f"except {type_str}{name_str}:\n")
             else:
-                self.formatted_code += "except:\n"
+                self.out.write("except:\n")
             self.current_indent += 1
-            for stmt in handler.body:
-                self.visit(stmt)
+            yield from handler.body
             self.current_indent -= 1
         if node.orelse:
             self.write_indent()
-            self.formatted_code += "else:\n"
+            self.out.write("else:\n")
             self.current_indent += 1
-            for stmt in node.orelse:
-                self.visit(stmt)
+            yield from node.orelse
             self.current_indent -= 1
         if node.finalbody:
             self.write_indent()
-            self.formatted_code += "finally:\n"
+            self.out.write("finally:\n")
             self.current_indent += 1
-            for stmt in node.finalbody:
-                self.visit(stmt)
+            yield from node.finalbody
             self.current_indent -= 1
 
     def visit_With(self, node):
         self.write_indent()
         items = [self.get_node_name(item.context_expr) for item in node.items]
         items_str = ', '.join(items)
-        self.formatted_code += f"with {items_str}:\n"
+        self.out.write(f"with {items_str}:\n")
         self.current_indent += 1
-        for stmt in node.body:
-            self.visit(stmt)
+        yield from node.body
         self.current_indent -= 1
 
     def write_indent(self):
-        self.formatted_code += ' ' * (self.current_indent * self.indent_size)
+        self.out.write(self.out.indent(self.current_indent))
 
+    # Expressions are printed by the expr_* method registered for their node
+    # type in EXPR_PRINTERS below; unknown node types print as ''. Printers
+    # for leaf nodes return the text directly. The others are generators that
+    # yield each sub-expression and are sent back its text; get_node_name runs
+    # them from an explicit stack, so deeply nested expressions do not recurse.
     def get_node_name(self, node):
         if node is None:
             return ''
-        if isinstance(node, ast.Name):
-            return node.id
-        elif isinstance(node, ast.Call):
-            func_name = self.get_node_name(node.func)
-            args = [self.get_node_name(arg) for arg in node.args]
-            args_str = ', '.join(args)
-            return f"{func_name}({args_str})"
-        elif isinstance(node, ast.Constant):
-            return repr(node.value)
-        elif isinstance(node, ast.Str):  # For Python <3.8
-            return repr(node.s)
-        elif isinstance(node, ast.Num):  # For Python <3.8
-            return repr(node.n)
-        elif isinstance(node, ast.BinOp):
-            left = self.get_node_name(node.left)
-            op = self.get_operator(node.op)
-            right = self.get_node_name(node.right)
-            return f"({left} {op} {right})"
-        elif isinstance(node, ast.Attribute):
-            value = self.get_node_name(node.value)
-            return f"{value}.{node.attr}"
-        elif isinstance(node, ast.Subscript):
-            value = self.get_node_name(node.value)
-            slice_ = self.get_node_name(node.slice)
-            return f"{value}[{slice_}]"
-        elif isinstance(node, ast.Index):  # For Python <3.9
-            return self.get_node_name(node.value)
-        elif isinstance(node, ast.Slice):
-            lower = self.get_node_name(node.lower)
-            upper = self.get_node_name(node.upper)
-            step = self.get_node_name(node.step)
-            slice_parts = ':'.join(filter(None, [lower, upper, step]))
-            return slice_parts
-        elif isinstance(node, ast.ListComp):
-            elt = self.get_node_name(node.elt)
-            generators = ' '.join([self.get_node_name(gen) for gen in node.generators])
-            return f"[{elt} {generators}]"
-        elif isinstance(node, ast.GeneratorExp):
-            elt = self.get_node_name(node.elt)
-            generators = ' '.join([self.get_node_name(gen) for gen in node.generators])
-            return f"({elt} {generators})"
-        elif isinstance(node, ast.Dict):
-            keys = [self.get_node_name(k) for k in node.keys]
-            values = [self.get_node_name(v) for v in node.values]
-            items = ', '.join(f"{k}: {v}" for k, v in zip(keys, values))
-            return f"{{{items}}}"
-        elif isinstance(node, ast.List):
-            elements = [self.get_node_name(e) for e in node.elts]
-            return f"[{', '.join(elements)}]"
-        elif isinstance(node, ast.Tuple):
-            elements = [self.get_node_name(e) for e in node.elts]
-            return f"({', '.join(elements)})"
-        elif isinstance(node, ast.comprehension):
-            target = self.get_node_name(node.target)
-            iter_ = self.get_node_name(node.iter)
-            ifs = ' '.join([f"if {self.get_node_name(if_)}" for if_ in node.ifs])
-            return f"for {target} in {iter_} {ifs}"
-        elif isinstance(node, ast.Lambda):
-            args = [arg.arg for arg in node.args.args]
-            body = self.get_node_name(node.body)
-            return f"lambda {', '.join(args)}: {body}"
-        elif isinstance(node, ast.Compare):
-            left = self.get_node_name(node.left)
-            ops = [self.get_operator(op) for op in node.ops]
-            comparators = [self.get_node_name(comp) for comp in node.comparators]
-            comparisons = ' '.join(f"{op} {comp}" for op, comp in zip(ops, comparators))
-            return f"{left} {comparisons}"
-        elif isinstance(node, ast.BoolOp):
-            op = self.get_operator(node.op)
-            values = [self.get_node_name(v) for v in node.values]
-            return f" {op} ".join(values)
-        elif isinstance(node, ast.UnaryOp):
-            op = self.get_operator(node.op)
-            operand = self.get_node_name(node.operand)
-            return f"{op}{operand}"
-        else:
+        printers = self.EXPR_PRINTERS
+        printer = printers.get(node.__class__)
+        if printer is None:
             return ''
+        result = printer(self, node)
+        if result.__class__ is str:
+            return result
+        stack = [result]
+        text = None
+        while True:
+            try:
+                child = stack[-1].send(text)
+            except StopIteration as stop:
+                stack.pop()
+                text = stop.value
+                if not stack:
+                    return text
+                continue
+            printer = printers.get(child.__class__) if child is not None else None
+            if printer is None:
+                text = ''
+                continue
+            result = printer(self, child)
+            if result.__class__ is str:
+                text = result
+            else:
+                stack.append(result)
+                text = None
+
+    def _print_all(self, nodes):
+        texts = []
+        for node in nodes:
+            texts.append((yield node))
+        return texts
+
+    def expr_Name(self, node):
+        return node.id
+
+    def expr_Constant(self, node):
+        return repr(node.value)
+
+    def expr_Call(self, node):
+        func_name = yield node.func
+        args = yield from self._print_all(node.args)
+        args += yield from self._print_all(node.keywords)
+        return f"{func_name}({', '.join(args)})"
+
+    def expr_keyword(self, node):
+        value = yield node.value
+        return f"**{value}" if node.arg is None else f"{node.arg}={value}"
+
+    def expr_Starred(self, node):
+        value = yield node.value
+        return f"*{value}"
+
+    def expr_Attribute(self, node):
+        value = yield node.value
+        return f"{value}.{node.attr}"
+
+    def expr_Subscript(self, node):
+        value = yield node.value
+        slice_ = yield node.slice
+        return f"{value}[{slice_}]"
+
+    def expr_Slice(self, node):
+        lower = yield node.lower
+        upper = yield node.upper
+        step = yield node.step
+        return ':'.join(filter(None, [lower, upper, step]))
+
+    def expr_BinOp(self, node):
+        left = yield node.left
+        op = OPERATORS.get(node.op.__class__, '')
+        right = yield node.right
+        return f"({left} {op} {right})"
+
+    def expr_UnaryOp(self, node):
+        op = OPERATORS.get(node.op.__class__, '')
+        operand = yield node.operand
+        return f"{op}{operand}"
+
+    def expr_BoolOp(self, node):
+        op = OPERATORS.get(node.op.__class__, '')
+        values = yield from self._print_all(node.values)
+        return f" {op} ".join(values)
+
+    def expr_Compare(self, node):
+        left = yield node.left
+        comparators = yield from self._print_all(node.comparators)
+        comparisons = ' '.join(f"{OPERATORS.get(op.__class__, '')} {comp}"
+                               for op, comp in zip(node.ops, comparators))
+        return f"{left} {comparisons}"
+
+    def expr_IfExp(self, node):
+        body = yield node.body
+        test = yield node.test
+        orelse = yield node.orelse
+        return f"({body} if {test} else {orelse})"
+
+    def expr_NamedExpr(self, node):
+        target = yield node.target
+        value = yield node.value
+        return f"({target} := {value})"
+
+    def expr_Lambda(self, node):
+        args = [arg.arg for arg in node.args.args]
+        body = yield node.body
+        return f"lambda {', '.join(args)}: {body}"
+
+    def expr_Await(self, node):
+        value = yield node.value
+        return f"await {value}"
+
+    # yield is always parenthesized so it stays valid inside other expressions
+    def expr_Yield(self, node):
+        if node.value is None:
+            return "(yield)"
+        value = yield node.value
+        return f"(yield {value})"
+
+    def expr_YieldFrom(self, node):
+        value = yield node.value
+        return f"(yield from {value})"
+
+    def expr_JoinedStr(self, node):
+        # f-strings are printed as written; quoting rules make them awkward
+        # to rebuild piece by piece
+        return ast.unparse(node)
+
+    def expr_List(self, node):
+        elements = yield from self._print_all(node.elts)
+        return f"[{', '.join(elements)}]"
+
+    def expr_Tuple(self, node):
+        elements = yield from self._print_all(node.elts)
+        return f"({', '.join(elements)})"
+
+    def expr_Set(self, node):
+        elements = yield from self._print_all(node.elts)
+        return f"{{{', '.join(elements)}}}"
+
+    def expr_Dict(self, node):
+        items = []
+        for k, v in zip(node.keys, node.values):
+            if k is None:
+                value = yield v
+                items.append(f"**{value}")
+            else:
+                key = yield k
+                value = yield v
+                items.append(f"{key}: {value}")
+        return f"{{{', '.join(items)}}}"
+
+    def expr_comprehension(self, node):
+        target = yield node.target
+        iter_ = yield node.iter
+        conditions = yield from self._print_all(node.ifs)
+        ifs = ' '.join([f"if {if_}" for if_ in conditions])
+        for_ = "async for" if node.is_async else "for"
+        return f"{for_} {target} in {iter_} {ifs}"
+
+    def expr_ListComp(self, node):
+        elt = yield node.elt
+        generators = yield from self._print_all(node.generators)
+        return f"[{elt} {' '.join(generators)}]"
+
+    def expr_GeneratorExp(self, node):
+        elt = yield node.elt
+        generators = yield from self._print_all(node.generators)
+        return f"({elt} {' '.join(generators)})"
+
+    def expr_SetComp(self, node):
+        elt = yield node.elt
+        generators = yield from self._print_all(node.generators)
+        return f"{{{elt} {' '.join(generators)}}}"
+
+    def expr_DictComp(self, node):
+        key = yield node.key
+        value = yield node.value
+        generators = yield from self._print_all(node.generators)
+        return f"{{{key}: {value} {' '.join(generators)}}}"
+
+    EXPR_PRINTERS = {
+        ast.Name: expr_Name,
+        ast.Constant: expr_Constant,
+        ast.Call: expr_Call,
+        ast.keyword: expr_keyword,
+        ast.Starred: expr_Starred,
+        ast.Attribute: expr_Attribute,
+        ast.Subscript: expr_Subscript,
+        ast.Slice: expr_Slice,
+        ast.BinOp: expr_BinOp,
+        ast.UnaryOp: expr_UnaryOp,
+        ast.BoolOp: expr_BoolOp,
+        ast.Compare: expr_Compare,
+        ast.IfExp: expr_IfExp,
+        ast.NamedExpr: expr_NamedExpr,
+        ast.Lambda: expr_Lambda,
+        ast.Await: expr_Await,
+        ast.Yield: expr_Yield,
+        ast.YieldFrom: expr_YieldFrom,
+        ast.JoinedStr: expr_JoinedStr,
+        ast.List: expr_List,
+        ast.Tuple: expr_Tuple,
+        ast.Set: expr_Set,
+        ast.Dict: expr_Dict,
+        ast.comprehension: expr_comprehension,
+        ast.ListComp: expr_ListComp,
+        ast.GeneratorExp: expr_GeneratorExp,
+        ast.SetComp: expr_SetComp,
+        ast.DictComp: expr_DictComp,
+    }
 
     def get_operator(self, op):
-        operators = {
-            ast.Add: '+',
-            ast.Sub: '-',
-            ast.Mult: '*',
-            ast.MatMult: '@',
-            ast.Div: '/',
-            ast.Mod: '%',
-            ast.Pow: '**',
-            ast.LShift: '<<',
-            ast.RShift: '>>',
-            ast.BitOr: '|',
-            ast.BitXor: '^',
-            ast.BitAnd: '&',
-            ast.FloorDiv: '//',
-            ast.And: 'and',
-            ast.Or: 'or',
-            ast.Invert: '~',
-            ast.Not: 'not ',
-            ast.UAdd: '+',
-            ast.USub: '-',
-            ast.Eq: '==',
-            ast.NotEq: '!=',
-            ast.Lt: '<',
-            ast.LtE: '<=',
-            ast.Gt: '>',
-            ast.GtE: '>=',
-            ast.Is: 'is',
-            ast.IsNot: 'is not',
-            ast.In: 'in',
-            ast.NotIn: 'not in',
-        }
-        return operators.get(type(op), '')
-    
-    def visualize_ast(self, code):
+        return OPERATORS.get(type(op), '')
+
+    # Returns a visualize.TreeView; see there for how large trees are cut down
+    def visualize_ast(self, code, max_depth=6, max_nodes=300):
         try:
-            tree = ast.parse(code)
-            graph = Digraph(format="png")
-            self._add_nodes(graph, tree, "root")
-            return graph
+            if self.stats is not None:
+                with self.stats.stage("python.parse"):
+                    tree = ast.parse(code)
+            else:
+                tree = ast.parse(code)
         except SyntaxError as e:
+            from tkinter import messagebox
             messagebox.showerror("Syntax Error", f"{e}")
             return None
+        return self.visualize_tree(tree, max_depth, max_nodes)
+
+    def visualize_tree(self, tree, max_depth=6, max_nodes=300):
+        from visualize import TreeView
+        return TreeView(tree, lambda node: list(ast.iter_child_nodes(node)),
+                        lambda node: type(node).__name__, max_depth, max_nodes, self.stats)
+
+# Lines that cannot start a top-level statement although nothing is
+# indented: the rest of an if/try, a closing bracket, a comment
+_NOT_STATEMENT_STARTS = ("else", "elif", "except", "finally", ")", "]", "}", "#")
+
+# Returns the indexes of the lines where format_source_parallel cuts a module
+# into chunks of at least chunk_lines lines. Only the start of a line and the
+# line before it are looked at, so a line inside a string or a bracket can
+# pass for the start of a statement; the chunk before such a cut does not
+# parse.
+def _split_lines(lines, chunk_lines):
+    starts = [0]
+    i = chunk_lines
+    while i < len(lines):
+        line = lines[i]
+        previous = lines[i - 1]
+        if (line[:1] not in " \t\r\n\f" and not line.startswith(_NOT_STATEMENT_STARTS)
+                and not previous.startswith("@") and not previous.rstrip("\r\n").endswith("\\")):
+            starts.append(i)
+            i += chunk_lines
+        else:
+            i += 1
+    return starts
+
+# Makes a SyntaxError from a chunk that starts at line index offset point at
+# the line in the whole module
+def _shift_lines(error, offset):
+    if error.lineno is not None:
+        error.lineno += offset
+    if getattr(error, "end_lineno", None) is not None:
+        error.end_lineno += offset
+    return error
+
+# Runs in a worker process for format_source_parallel
+def _format_segment(segment, indent_size):
+    formatter = CodeFormatter()
+    formatter.indent_size = indent_size
+    return formatter.format_source(segment)
+
+# Formatter for repeated calls on the same, slowly changing code (format as
+# you type). Each top-level statement is keyed by its source text, and only
+# statements whose text is new since the previous update are formatted again.
+class IncrementalCodeFormatter:
+    def __init__(self, formatter=None):
+        self.formatter = formatter if formatter is not None else CodeFormatter()
+        self.cache = {}
+        self.reformatted = 0
+
+    # Returns the formatted code as a list with one string per top-level
+    # statement, or raises SyntaxError
+    def update(self, code):
+        tree = ast.parse(code)
+        # Split like the tokenizer does (\n, \r\n, \r) so line numbers match
+        lines = io.StringIO(code, newline="").readlines()
+        cache = {}
+        regions = []
+        self.reformatted = 0
+        for stmt in tree.body:
+            first = min([stmt.lineno] + [d.lineno for d in getattr(stmt, "decorator_list", ())])
+            source = "".join(lines[first - 1:stmt.end_lineno]).rstrip("\r\n")
+            key = (source, stmt.col_offset, stmt.end_col_offset)
+            text = cache.get(key) or self.cache.get(key)
+            if text is None:
+                text = self.formatter.format_node(stmt)
+                self.reformatted += 1
+            cache[key] = text
+            regions.append(text)
+        self.cache = cache
+        return regions
+
+# Second Python engine that works on the token stream instead of the AST. It
+# keeps comments and blank lines (at most max_blank_lines in a row), only
+# ever holds the current logical line and yields each output line as soon as
+# it is complete, so the first lines of a huge module arrive before the rest
+# has been read. Whitespace between tokens is normalized (spaces around
+# binary operators and after commas, none inside brackets, keyword arguments
+# and defaults without spaces) and blocks are re-indented with indent_size
+# spaces. Line breaks inside brackets and backslash continuations are kept;
+# tokens themselves (strings, numbers, comments) are never changed.
+class TokenFormatter:
+    def __init__(self, indent_size=4, max_blank_lines=2):
+        self.indent_size = indent_size
+        self.max_blank_lines = max_blank_lines
+
+    # Raises SyntaxError for input that does not tokenize
+    def format(self, code):
+        return "".join(self.format_lines(code))
+
+    # source is a string, a file object or an iterable of lines
+    def format_lines(self, source):
+        import tokenize
+        if isinstance(source, str):
+            source = io.StringIO(source)
+        readline = source.readline if hasattr(source, "readline") else iter(source).__next__
+        # Python 3.12+ splits f-strings into parts. To copy them verbatim, the
+        # physical lines of the current logical line are kept by row number.
+        rows = {}
+        if hasattr(tokenize, "FSTRING_START"):
+            readline = _recording_reader(readline, rows)
+
+        try:
+            yield from self._format_tokens(tokenize.generate_tokens(readline), rows)
+        except tokenize.TokenError as e:
+            message, (row, col) = e.args
+            raise SyntaxError(message, ("<unknown>", row, col + 1, None)) from None
+
+    def _format_tokens(self, tokens, rows):
+        import keyword
+        NAME, OP, STRING, COMMENT = token.NAME, token.OP, token.STRING, token.COMMENT
+        NL, NEWLINE, INDENT, DEDENT = token.NL, token.NEWLINE, token.INDENT, token.DEDENT
+        FSTRING_START = getattr(token, "FSTRING_START", None)
+        FSTRING_END = getattr(token, "FSTRING_END", None)
+        keywords = set(keyword.kwlist) - {"True", "False", "None"}
+        # Used instead of keywords right after match, case or type where
+        # they start a statement (see _soft_keyword)
+        soft_keywords = keywords | {"match", "case", "type"}
+
+        depth = 0
+        widths = [0]            # original indentation of each open block
+        # One entry per open bracket (plus one for the statement level):
+        # [bracket, lambdas awaiting their colon, annotation seen since the last comma]
+        brackets = [[None, 0, False]]
+        pieces = []             # the output line being built
+        prev = None             # previous token on this output line
+        tight = False           # no space after prev
+        block_opened = False    # last logical line ended with ":"
+        blanks = 0
+        fstring = None          # (start, nesting) while inside an f-string
+        soft = None             # soft keyword starting the current statement
+        case_depths = []        # block depth of the case clauses of each open match
+        ahead = collections.deque()
+        tokens = iter(tokens)
+
+        while True:
+            tok = ahead.popleft() if ahead else next(tokens, None)
+            if tok is None:
+                break
+            kind, text = tok.type, tok.string
+            if fstring is not None:
+                if kind == FSTRING_START:
+                    fstring = (fstring[0], fstring[1] + 1)
+                elif kind == FSTRING_END:
+                    if fstring[1]:
+                        fstring = (fstring[0], fstring[1] - 1)
+                        continue
+                    tok = tok._replace(type=STRING, string=_slice_rows(rows, fstring[0], tok.end),
+                                       start=fstring[0])
+                    kind, text = STRING, tok.string
+                    fstring = None
+                if fstring is not None:
+                    continue
+            elif kind == FSTRING_START:
+                fstring = (tok.start, 0)
+                continue
+
+            if kind == INDENT:
+                depth += 1
+                widths.append(tok.end[1])
+                continue
+            if kind == DEDENT:
+                depth -= 1
+                widths.pop()
+                while case_depths and case_depths[-1] > depth:
+                    case_depths.pop()
+                continue
+            if kind in (NEWLINE, NL):
+                if len(brackets) > 1:
+                    continue
+                if pieces:
+                    yield "".join(pieces) + "\n"
+                    pieces = []
+                    if kind == NEWLINE:
+                        block_opened = prev is not None and prev.string == ":"
+                elif kind == NL:
+                    blanks += 1
+                prev = None
+                if rows:
+                    for row in [row for row in rows if row <= tok.end[0]]:
+                        del rows[row]
+                continue
+            if kind == token.ENDMARKER:
+                break
+            if kind == token.ERRORTOKEN and text.isspace():
+                continue
+
+            if prev is None:
+                # First token of a line
+                if blanks:
+                    yield "\n" * min(blanks, self.max_blank_lines)
+                    blanks = 0
+                level = depth
+                soft = None
+                if kind == NAME and len(brackets) == 1 and self._soft_keyword(tok, tokens, ahead, depth, case_depths):
+                    soft = tok
+                    if text == "match":
+                        case_depths.append(depth + 1)
+                if kind == COMMENT:
+                    # Comments go with the block their column belongs to
+                    col = tok.start[1]
+                    level = max(d for d, width in enumerate(widths) if width <= col or d == 0)
+                    if block_opened and col > widths[-1]:
+                        level += 1
+                pieces.append(" " * (level * self.indent_size))
+            elif tok.start[0] > prev.end[0]:
+                # Continuation line: inside brackets one level per open
+                # bracket, after a backslash one level
+                opened = len(brackets) - 1
+                if opened:
+                    opened -= text in (")", "]", "}")
+                    yield "".join(pieces) + "\n"
+                else:
+                    opened = 1
+                    yield "".join(pieces) + " \\\n"
+                pieces = [" " * ((depth + opened) * self.indent_size)]
+            else:
+                space = self._space(prev, tok, tight, brackets[-1], soft_keywords if prev is soft else keywords)
+                if space:
+                    pieces.append(space)
+
+            tight = False
+            top = brackets[-1]
+            if kind == OP:
+                if text in ("(", "[", "{"):
+                    brackets.append([text, 0, False])
+                    tight = True
+                elif text in (")", "]", "}"):
+                    if len(brackets) > 1:
+                        brackets.pop()
+                elif text == ",":
+                    top[2] = False
+                elif text == ":":
+                    if top[1]:
+                        top[1] -= 1
+                    elif top[0] == "[":
+                        tight = True
+                    else:
+                        top[2] = True
+                elif text == "=":
+                    tight = self._tight_equals(top)
+                elif text == "." or text in ("-", "+", "~", "*", "**", "@") and \
+                        self._unary(prev, soft_keywords if prev is soft else keywords):
+                    tight = True
+            elif kind == NAME and text == "lambda":
+                top[1] += 1
+            pieces.append(text)
+            prev = tok
+
+        if pieces:
+            yield "".join(pieces) + "\n"
+
+    # Whether tok, the first token of a logical line, is match, case or type
+    # used as a keyword rather than as a name. case only is one directly
+    # inside a match block; match needs its line to end in ":" and type to be
+    # followed by a name, which is found out by reading the rest of the line
+    # into ahead.
+    def _soft_keyword(self, tok, tokens, ahead, depth, case_depths):
+        text = tok.string
+        if text == "case":
+            return bool(case_depths) and case_depths[-1] == depth
+        if text not in ("match", "type"):
+            return False
+        if not ahead:
+            following = next(tokens, None)
+            if following is None:
+                return False
+            ahead.append(following)
+        if text == "type":
+            return ahead[0].type == token.NAME
+        nesting = 0
+        last = None
+        i = 0
+        while True:
+            if i == len(ahead):
+                following = next(tokens, None)
+                if following is None:
+                    break
+                ahead.append(following)
+            current = ahead[i]
+            i += 1
+            if current.type in (token.NEWLINE, token.ENDMARKER):
+                break
+            if current.type == token.OP:
+                if current.string in ("(", "[", "{"):
+                    nesting += 1
+                elif current.string in (")", "]", "}"):
+                    nesting -= 1
+            if current.type not in (token.COMMENT, token.NL):
+                last = (current.string, nesting)
+        return last == (":", 0) and ahead[0].string != ":"
+
+    def _tight_equals(self, top):
+        # Keyword arguments, defaults and lambda defaults; annotated
+        # parameters keep their spaces
+        return top[1] > 0 or top[0] == "(" and not top[2]
+
+    def _unary(self, prev, keywords):
+        if prev is None:
+            return True
+        if prev.type == token.OP:
+            return prev.string not in (")", "]", "}", "...")
+        return prev.string in keywords
+
+    # The whitespace between prev and tok on the same line
+    def _space(self, prev, tok, tight, top, keywords):
+        text = tok.string
+        if tok.type == token.COMMENT:
+            return "  "
+        if token.ERRORTOKEN in (tok.type, prev.type):
+            # Characters the tokenizer does not know (some identifiers on
+            # older Pythons) keep their original spacing
+            return "" if prev.end == tok.start else " "
+        if tok.type == token.OP and text in (")", "]", "}", ",", ";", ":"):
+            return " " if text == ":" and prev.string == "," else ""
+        if tight:
+            return " " if prev.string == "." and text == "import" else ""
+        if text == ".":
+            # "1 .real" needs its space
+            return " " if prev.string in keywords or prev.type == token.NUMBER else ""
+        if prev.string == "..." and tok.type == token.NAME and text not in keywords:
+            # from ...package import name
+            return ""
+        if text in ("(", "["):
+            if prev.type == token.NAME and prev.string not in keywords or prev.type == token.STRING:
+                return ""
+            if prev.string in (")", "]", "}"):
+                return ""
+        if text == "=" and self._tight_equals(top):
+            return ""
+        return " "
+
+def _recording_reader(readline, rows):
+    row = 0
+
+    def read():
+        nonlocal row
+        line = readline()
+        row += 1
+        rows[row] = line
+        return line
+    return read
+
+# Source text from start to end (both (row, col)) out of the recorded rows
+def _slice_rows(rows, start, end):
+    (first, col), (last, end_col) = start, end
+    if first == last:
+        return rows[first][col:end_col]
+    return rows[first][col:] + "".join(rows[row] for row in range(first + 1, last)) + rows[last][:end_col]
 
-    def _add_nodes(self, graph, node, parent_name):
-        node_id = str(id(node))
-        label = type(node).__name__
-        graph.node(node_id, label)
-
-        if parent_name != "root":
-            graph.edge(parent_name, node_id)
-
-        for child in ast.iter_child_nodes(node):
-            self._add_nodes(graph, child, node_id)
-
-# GUI Application
-
-class FormatterGUI:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Python Code Formatter")
-
-        # Input Text Widget
-        self.input_label = tk.Label(root, text="Unformatted Code:")
-        self.input_label.pack()
-        self.input_text = tk.Text(root, height=10, width=80)
-        self.input_text.pack()
-
-        # Buttons
-        self.format_button = tk.Button(root, text="Format Code", command=self.format_code)
-        self.format_button.pack()
-
-        self.visualize_button = tk.Button(root, text="Visualize LL Parsing", command=self.visualize_code)
-        self.visualize_button.pack()
-
-        # Output Text Widget
-        self.output_label = tk.Label(root, text="Formatted Code:")
-        self.output_label.pack()
-        self.output_text = tk.Text(root, height=10, width=80)
-        self.output_text.pack()
-
-    def format_code(self):
-        code = self.input_text.get("1.0", tk.END)
-        formatter = CodeFormatter()
-        formatted_code = formatter.format_code(code)
-        self.output_text.delete("1.0", tk.END)
-        self.output_text.insert(tk.END, formatted_code)
-
-    def visualize_code(self):
-        code = self.input_text.get("1.0", tk.END)
-        formatter = CodeFormatter()
-        graph = formatter.visualize_ast(code)
-        if graph:
-            graph.render('ast_tree', format='png', cleanup=False)
-            img = Image.open('ast_tree.png')
-            img = img.resize((600, 400))
-            img = ImageTk.PhotoImage(img)
+# The GUI is only loaded when asked for
+def __getattr__(name):
+    if name == "FormatterGUI":
+        from python_gui import FormatterGUI
+        return FormatterGUI
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Main Execution
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = FormatterGUI(root)
-    root.mainloop()
+    from python_gui import main
+    main()
@@ -0,0 +1,246 @@
+# Helpers shared by the Tk front ends (python_gui.py, html_gui.py).
+import difflib
+import io
+import queue
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox, ttk
+from PIL import Image, ImageTk
+
+
+def patch_text(widget, old_regions, new_regions):
+    # The widget holds "".join(old_regions). Only the regions that differ
+    # from new_regions are replaced, so the cost follows the size of the edit
+    # rather than of the document. Regions need not end in a newline, so
+    # each one's start is kept as a line and column.
+    if old_regions is None:
+        widget.delete("1.0", tk.END)
+        widget.insert(tk.END, "".join(new_regions))
+        return
+    starts = [(1, 0)]
+    for region in old_regions:
+        line, column = starts[-1]
+        newlines = region.count("\n")
+        if newlines:
+            starts.append((line + newlines, len(region) - region.rfind("\n") - 1))
+        else:
+            starts.append((line, column + len(region)))
+    matcher = difflib.SequenceMatcher(None, old_regions, new_regions, autojunk=False)
+    # Patch from the bottom up so earlier positions stay valid
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == "equal":
+            continue
+        start = "%d.%d" % starts[i1]
+        if i2 > i1:
+            widget.delete(start, "%d.%d" % starts[i2])
+        if j2 > j1:
+            widget.insert(start, "".join(new_regions[j1:j2]))
+
+
+# Runs formatting and rendering jobs on a worker thread so the Tk main loop
+# keeps handling events. Jobs are submitted under a name ("format",
+# "visualize", ...); a newer job with the same name supersedes the older one,
+# which is cancelled if it has not started yet and has its result dropped
+# otherwise. Results are handed back to the Tk thread by polling with
+# root.after, and an indeterminate progress bar runs while any job is busy.
+class BackgroundRunner:
+    def __init__(self, root, progress=None, poll_ms=50):
+        self.root = root
+        self.progress = progress
+        self.poll_ms = poll_ms
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.results = queue.Queue()
+        self.generations = {}
+        self.futures = {}
+        self.timers = {}
+        self.busy = 0
+        self.polling = False
+
+    # job runs on the worker thread; on_done(result) or on_error(exception)
+    # run on the Tk thread. With debounce_ms the job only starts once no newer
+    # submission under the same name has arrived for that long.
+    def submit(self, name, job, on_done, on_error=None, debounce_ms=0):
+        generation = self.generations.get(name, 0) + 1
+        self.generations[name] = generation
+        timer = self.timers.pop(name, None)
+        if timer is not None:
+            self.root.after_cancel(timer)
+        if debounce_ms:
+            self.timers[name] = self.root.after(debounce_ms, self._start, name, generation,
+                                                job, on_done, on_error)
+        else:
+            self._start(name, generation, job, on_done, on_error)
+
+    def _start(self, name, generation, job, on_done, on_error):
+        self.timers.pop(name, None)
+        previous = self.futures.pop(name, None)
+        if previous is not None and previous.cancel():
+            self._set_busy(-1)
+        future = self.executor.submit(job)
+        self.futures[name] = future
+        self._set_busy(+1)
+        future.add_done_callback(
+            lambda f: self.results.put((name, generation, f, on_done, on_error)))
+        if not self.polling:
+            self.polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        while True:
+            try:
+                name, generation, future, on_done, on_error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if future.cancelled():
+                continue
+            self._set_busy(-1)
+            if self.futures.get(name) is future:
+                del self.futures[name]
+            if generation != self.generations.get(name):
+                continue
+            error = future.exception()
+            if error is None:
+                on_done(future.result())
+            elif on_error is not None:
+                on_error(error)
+        if self.busy:
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self.polling = False
+
+    def _set_busy(self, delta):
+        self.busy += delta
+        if self.progress is None:
+            return
+        if delta > 0 and self.busy == 1:
+            self.progress.start(10)
+        elif self.busy == 0:
+            self.progress.stop()
+
+    def shutdown(self):
+        for timer in self.timers.values():
+            self.root.after_cancel(timer)
+        self.timers.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Formatter window for one registry language (see registry.py): input and
+# output text, Format and Visualize buttons, format as you type and the tree
+# image. Subclasses set the texts and can add widgets in add_options().
+class FormatterWindow:
+    title = "Formatter"
+    noun = "Code"
+    # Whether errors from format as you type are shown; if not, the last good
+    # output stays while the input does not parse
+    live_errors = True
+
+    def __init__(self, root, language):
+        self.root = root
+        self.language = language
+        self.root.title(self.title)
+
+        self.input_label = tk.Label(root, text=f"Unformatted {self.noun}:")
+        self.input_label.pack()
+        self.input_text = tk.Text(root, height=10, width=80)
+        self.input_text.pack()
+
+        self.format_button = tk.Button(root, text="Format Code", command=self.format_code)
+        self.format_button.pack()
+
+        self.visualize_button = tk.Button(root, text="Visualize LL Parsing", command=self.visualize_code)
+        self.visualize_button.pack()
+
+        # Large trees are drawn cut down; this opens the collapsed parts one level further
+        self.expand_button = tk.Button(root, text="Show More of Tree", command=self.expand_view)
+        self.expand_button.pack()
+        self.view = None
+
+        self.add_options()
+
+        # Live mode re-formats only the top-level parts that changed on each key press
+        self.live_var = tk.BooleanVar(value=False)
+        self.live_check = tk.Checkbutton(root, text="Format as you type", variable=self.live_var)
+        self.live_check.pack()
+        self.incremental = language.incremental()
+        self.output_regions = None
+        self.input_text.bind("<KeyRelease>", self.format_live)
+
+        self.output_label = tk.Label(root, text=f"Formatted {self.noun}:")
+        self.output_label.pack()
+        self.output_text = tk.Text(root, height=10, width=80)
+        self.output_text.pack()
+
+        # Parsing, formatting and rendering run on a worker thread
+        self.progress = ttk.Progressbar(root, mode="indeterminate", length=200)
+        self.progress.pack()
+        self.runner = BackgroundRunner(root, self.progress)
+        self.image_label = tk.Label(root)
+        self.image_label.pack()
+        self.image = None
+
+    def add_options(self):
+        pass
+
+    # Keyword arguments for the language's formatter
+    def format_options(self):
+        return {}
+
+    def format_code(self):
+        code = self.input_text.get("1.0", tk.END)
+        options = self.format_options()
+        self.runner.submit("format", lambda: self.language.format(code, **options),
+                           self.show_formatted, self.show_error)
+
+    def show_formatted(self, formatted_code):
+        self.output_text.delete("1.0", tk.END)
+        self.output_text.insert(tk.END, formatted_code)
+        self.output_regions = None
+
+    def show_error(self, error):
+        messagebox.showerror("Error", str(error))
+
+    def format_live(self, event=None):
+        if not self.live_var.get() or self.incremental is None:
+            return
+        code = self.input_text.get("1.0", tk.END)
+        self.runner.submit("format", lambda: self.incremental.update(code), self.show_regions,
+                           self.show_error if self.live_errors else None, debounce_ms=300)
+
+    def show_regions(self, regions):
+        patch_text(self.output_text, self.output_regions, regions)
+        self.output_regions = regions
+
+    def visualize_code(self):
+        code = self.input_text.get("1.0", tk.END)
+
+        def job():
+            view = self.language.visualize(code)
+            return view, self.render_view(view)
+
+        self.runner.submit("visualize", job, self.show_view, self.show_error)
+
+    def render_view(self, view):
+        # Runs on the worker thread; Graphviz output is read from memory
+        img = Image.open(io.BytesIO(view.pipe(format="png")))
+        img.thumbnail((600, 400))
+        return img
+
+    def expand_view(self):
+        view = self.view
+        if view is None or not view.collapsed:
+            return
+        view.expand_collapsed()
+        self.runner.submit("visualize", lambda: (view, self.render_view(view)),
+                           self.show_view, self.show_error)
+
+    def show_view(self, result):
+        # PhotoImage has to be created on the Tk thread
+        self.view, img = result
+        self.image = ImageTk.PhotoImage(img)
+        self.image_label.configure(image=self.image)
+
+
+def run(window_class):
+    root = tk.Tk()
+    window_class(root)
+    root.mainloop()
@@ -0,0 +1,18 @@
+import registry
+from gui_support import FormatterWindow, run
+
+
+class FormatterGUI(FormatterWindow):
+    title = "HTML Formatter with Visualization"
+    noun = "HTML"
+
+    def __init__(self, root):
+        super().__init__(root, registry.get("html"))
+
+
+def main():
+    run(FormatterGUI)
+
+
+if __name__ == "__main__":
+    main()
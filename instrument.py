@@ -0,0 +1,130 @@
+# Opt-in profiling for the formatters.
+#
+# Pass a FormatterStats as stats= to CodeFormatter, HTMLFormatter or a
+# TreeView and it collects:
+#
+# - per-stage wall time: python.parse, python.exec, python.visit, html.feed
+#   (HTMLParser.feed including the tree building callbacks), html.build (the
+#   callbacks alone), html.write, visualize.dot, visualize.render
+# - per-node-type visit counts and time (statement types for Python, tag
+#   names and #text/#comment/#doctype for HTML). The time is the node's own:
+#   a FunctionDef does not include the time of the statements in its body.
+# - bytes in and out, counted as UTF-8
+#
+# The results export as JSON (to_json) or as a Chrome trace of the stages
+# (write_chrome_trace) that chrome://tracing and Perfetto open. With stats
+# left as None the formatters take their plain code paths, which check for
+# stats once per document and never per node.
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# HTMLParser callbacks that make up tree building. handle_startendtag is left
+# out because it calls handle_starttag and handle_endtag itself.
+_BUILD_CALLBACKS = ("handle_starttag", "handle_endtag", "handle_data", "handle_comment",
+                    "handle_decl", "handle_pi")
+
+
+class _CountingWriter:
+    def __init__(self, target, stats):
+        self.target = target
+        self.stats = stats
+
+    def write(self, text):
+        self.stats.bytes_out += len(text.encode("utf-8", "surrogatepass"))
+        return self.target.write(text)
+
+
+class FormatterStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.stages = {}    # name -> [calls, seconds]
+        self.nodes = {}     # type name -> [visits, seconds]
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # (name, start, duration, thread id) for the trace, times in seconds
+        self.events = []
+        self._origin = time.perf_counter()
+
+    def add_stage(self, name, seconds, start=None):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        if start is not None:
+            self.events.append((name, start - self._origin, seconds, threading.get_ident()))
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start, start)
+
+    def add_node(self, name, seconds, visits=1):
+        entry = self.nodes.get(name)
+        if entry is None:
+            entry = self.nodes[name] = [0, 0.0]
+        entry[0] += visits
+        entry[1] += seconds
+
+    def add_input(self, text):
+        self.bytes_in += len(text.encode("utf-8", "surrogatepass"))
+
+    def add_output(self, text):
+        if text is not None:
+            self.bytes_out += len(text.encode("utf-8", "surrogatepass"))
+
+    def wrap_output(self, out):
+        # A target for OutputSink that counts what passes through it
+        return _CountingWriter(out, self) if out is not None else None
+
+    def time_callbacks(self, parser, name="html.build"):
+        # Times the tree building callbacks of one HTMLParser instance by
+        # shadowing them with timed wrappers; no trace events, as there is
+        # one call per token
+        clock = time.perf_counter
+        for attr in _BUILD_CALLBACKS:
+            method = getattr(parser, attr, None)
+            if method is None:
+                continue
+
+            def timed(*args, _method=method):
+                start = clock()
+                try:
+                    return _method(*args)
+                finally:
+                    self.add_stage(name, clock() - start)
+            setattr(parser, attr, timed)
+        return parser
+
+    def to_dict(self):
+        return {
+            "stages": {name: {"calls": calls, "seconds": seconds}
+                       for name, (calls, seconds) in sorted(self.stages.items())},
+            "nodes": {name: {"visits": visits, "seconds": seconds}
+                      for name, (visits, seconds) in sorted(self.nodes.items(), key=lambda item: -item[1][1])},
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        events = [{"name": name, "cat": name.split(".")[0], "ph": "X", "pid": pid, "tid": tid,
+                   "ts": start * 1e6, "dur": duration * 1e6}
+                  for name, start, duration, tid in self.events]
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": self.to_dict()}
+
+    def write_chrome_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
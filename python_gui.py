@@ -0,0 +1,37 @@
+import tkinter as tk
+from tkinter import messagebox
+import registry
+from gui_support import FormatterWindow, run
+
+# GUI Application
+
+class FormatterGUI(FormatterWindow):
+    title = "Python Code Formatter"
+    noun = "Code"
+    # Half-typed code raises SyntaxError; the last good output then stays
+    live_errors = False
+
+    def __init__(self, root):
+        super().__init__(root, registry.get("python"))
+
+    def add_options(self):
+        self.execute_var = tk.BooleanVar(value=False)
+        self.execute_check = tk.Checkbutton(self.root, text="Run code before formatting", variable=self.execute_var)
+        self.execute_check.pack()
+
+    def format_options(self):
+        return {"execute": self.execute_var.get()}
+
+    def show_error(self, error):
+        if isinstance(error, SyntaxError):
+            messagebox.showerror("Syntax Error", f"{error}")
+        else:
+            messagebox.showerror("Runtime Error", str(error))
+
+
+def main():
+    run(FormatterGUI)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+# Registry of language formatters.
+#
+# Everything that formats files without caring about the language (cli.py,
+# cache keys, daemon.py, async_api.py, the GUIs, embedded blocks in HTML)
+# goes through a LanguageFormatter looked up here by name, file extension or
+# MIME type. A formatter for another language subclasses LanguageFormatter
+# and calls register():
+#
+#   class CSSFormatter(LanguageFormatter):
+#       name = "css"
+#       extensions = (".css",)
+#       mime_types = ("text/css",)
+#       def format(self, text, indent_size=4, **options): ...
+#
+#   register(CSSFormatter())
+#
+# Formatters with mime_types are also used for matching <style> and <script>
+# blocks when HTMLFormatter formats a page (see format_many). The built-in
+# formatters import their modules only when first used, so importing the
+# registry stays cheap.
+
+import os
+import threading
+
+
+class LanguageFormatter:
+    name = None
+    extensions = ()
+    mime_types = ()
+    # Module holding the implementation, imported by load()
+    module = None
+
+    def load(self):
+        if self.module:
+            __import__(self.module)
+
+    # Part of cache keys; change it whenever the output changes
+    def version(self):
+        return "1"
+
+    # Returns the formatted text; raises SyntaxError for input that cannot be
+    # parsed. options are passed on to the underlying formatter.
+    def format(self, text, indent_size=4, **options):
+        raise NotImplementedError
+
+    # Raises ValueError if formatted does not mean the same as original;
+    # called before a file is rewritten with the formatted text
+    def verify(self, original, formatted):
+        pass
+
+    # source is a string, file object or iterable of text chunks; yields the
+    # output in pieces. Formatters that can stream override this.
+    def format_lines(self, source, indent_size=4, **options):
+        if not isinstance(source, str):
+            source = source.read() if hasattr(source, "read") else "".join(source)
+        yield self.format(source, indent_size, **options)
+
+    # Returns a visualize.TreeView of the parsed input
+    def visualize(self, text, max_depth=6, max_nodes=300):
+        raise NotImplementedError
+
+    # Returns an object whose update(text) gives the output as a list of
+    # regions, reusing work from the previous call (format as you type)
+    def incremental(self):
+        return None
+
+
+class PythonFormatter(LanguageFormatter):
+    name = "python"
+    extensions = (".py",)
+    module = "for_python"
+
+    def version(self):
+        from for_python import FORMATTER_VERSION
+        return FORMATTER_VERSION
+
+    def format(self, text, indent_size=4, **options):
+        from for_python import CodeFormatter
+        formatter = CodeFormatter(**options)
+        formatter.indent_size = indent_size
+        return formatter.format_source(text)
+
+    def verify(self, original, formatted):
+        import ast
+        import io
+        import tokenize
+        try:
+            same = ast.dump(ast.parse(original)) == ast.dump(ast.parse(formatted))
+        except SyntaxError:
+            same = False
+        if not same:
+            raise ValueError("the formatted code does not parse to the same AST")
+
+        def comments(text):
+            return [token.string for token in tokenize.generate_tokens(io.StringIO(text).readline)
+                    if token.type == tokenize.COMMENT]
+
+        if comments(original) != comments(formatted):
+            raise ValueError("formatting would drop or change comments")
+
+    def visualize(self, text, max_depth=6, max_nodes=300):
+        import ast
+        from for_python import CodeFormatter
+        return CodeFormatter().visualize_tree(ast.parse(text), max_depth, max_nodes)
+
+    def incremental(self):
+        from for_python import IncrementalCodeFormatter
+        return IncrementalCodeFormatter()
+
+
+class HTMLLanguage(LanguageFormatter):
+    name = "html"
+    extensions = (".html", ".htm")
+    module = "for_html"
+
+    def version(self):
+        from for_html import FORMATTER_VERSION
+        return FORMATTER_VERSION
+
+    def format(self, text, indent_size=4, **options):
+        from for_html import HTMLFormatter
+        return HTMLFormatter(indent_size, **options).format_html(text)
+
+    def format_lines(self, source, indent_size=4, **options):
+        from for_html import HTMLFormatter
+        return HTMLFormatter(indent_size, **options).format_html_stream(source)
+
+    def visualize(self, text, max_depth=6, max_nodes=300):
+        from for_html import HTMLFormatter, HTMLTreeBuilder
+        parser = HTMLTreeBuilder()
+        parser.feed(text)
+        parser.close()
+        return HTMLFormatter().visualize_html_tree(parser.get_tree(), max_depth, max_nodes)
+
+    def incremental(self):
+        from for_html import IncrementalHTMLFormatter
+        return IncrementalHTMLFormatter()
+
+
+_FORMATTERS = {}
+_EXTENSIONS = {}
+_MIME_TYPES = {}
+
+
+def register(formatter):
+    # A later registration for the same name, extension or MIME type wins
+    _FORMATTERS[formatter.name] = formatter
+    for extension in formatter.extensions:
+        _EXTENSIONS[extension.lower()] = formatter
+    for mime_type in formatter.mime_types:
+        _MIME_TYPES[mime_type.lower()] = formatter
+
+
+def get(name):
+    # Raises KeyError for an unknown language
+    return _FORMATTERS[name]
+
+
+def names():
+    return list(_FORMATTERS)
+
+
+def extensions():
+    return list(_EXTENSIONS)
+
+
+def for_path(path):
+    # The formatter for a file name, or None
+    return _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def for_mime_type(mime_type):
+    return _MIME_TYPES.get(mime_type.lower())
+
+
+def has_mime_types():
+    return bool(_MIME_TYPES)
+
+
+def warm():
+    # Imports every formatter's implementation, e.g. in a fresh worker process
+    for formatter in _FORMATTERS.values():
+        formatter.load()
+
+
+# Module-level so process pools can pickle it
+def format_text(language, text, indent_size=4, **options):
+    return get(language).format(text, indent_size, **options)
+
+
+def _format_job(job):
+    language, text, indent_size = job
+    try:
+        return format_text(language, text, indent_size)
+    except Exception as e:
+        return e
+
+
+# Formats a batch of (language, text, indent_size) jobs and returns, in the
+# same order, the formatted text or the exception for each. Batches of more
+# than parallel_size characters go to a process pool, smaller ones are not
+# worth handing over. The pool is started on first use and kept for later
+# batches. Inside a worker process (cli.py, daemon.py, async_api.py run
+# formatting on pools of their own) batches are always formatted in place.
+def format_many(jobs, workers=None, parallel_size=256 * 1024):
+    jobs = list(jobs)
+    if len(jobs) < 2 or workers == 1 or sum(len(job[1]) for job in jobs) < parallel_size:
+        return [_format_job(job) for job in jobs]
+    import multiprocessing
+    if multiprocessing.parent_process() is not None:
+        return [_format_job(job) for job in jobs]
+    from concurrent.futures.process import BrokenProcessPool
+    pool = _shared_pool(workers)
+    try:
+        return list(pool.map(_format_job, jobs))
+    except BrokenProcessPool as e:
+        # A worker died, maybe of one of these jobs; the next batch gets a
+        # new pool
+        _drop_pool(pool)
+        return [e] * len(jobs)
+
+
+# Process pools for format_many by their number of workers
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _shared_pool(workers):
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers, initializer=warm)
+        return pool
+
+
+def _drop_pool(pool):
+    with _pools_lock:
+        for workers, shared in list(_pools.items()):
+            if shared is pool:
+                del _pools[workers]
+    pool.shutdown(wait=False)
+
+
+register(PythonFormatter())
+register(HTMLLanguage())
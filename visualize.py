@@ -0,0 +1,189 @@
+# Tree visualization that stays readable (and fast to lay out) on large
+# inputs. Instead of one Graphviz node per AST/DOM node, the tree is walked
+# breadth first and drawing stops at a depth limit and a node budget:
+#
+# - a node at max_depth whose children are hidden is drawn dashed with the
+#   number of hidden descendants, e.g. "FunctionDef (+312)"
+# - once max_nodes nodes are drawn, the remaining children of each parent are
+#   folded into a single "… 7 more" node
+#
+# Nodes are identified by their child-index path from the root ("0.2.1"), so
+# expand(path) keeps working when the view is rebuilt for an edited document.
+# An expanded node always shows all of its children, and they start a fresh
+# depth budget. The DOT source is built in memory; pipe() runs Graphviz on it
+# without touching the file system and keeps the image in RENDER_CACHE, and
+# render_many() renders a batch of views at once. stats takes an
+# instrument.FormatterStats that times dot() and pipe().
+
+import hashlib
+import threading
+from collections import OrderedDict, deque
+
+
+def _quote(text, limit=40):
+    text = str(text)
+    if len(text) > limit:
+        text = text[:limit - 1] + "…"
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+
+# Rendered images, keyed by a hash of the DOT source and the output format.
+# The DOT source describes exactly what is drawn, so equal trees (or equal
+# views of different trees) share an entry. Least recently used entries are
+# dropped once the images take more than max_bytes.
+class RenderCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, dot, format):
+        return hashlib.blake2b(f"{format}\0{dot}".encode("utf-8"), digest_size=20).digest()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                self.size -= len(self._entries.popitem(last=False)[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+RENDER_CACHE = RenderCache()
+
+
+# Runs dot on the source through pipes and returns the image bytes; nothing
+# is written to disk. Pass cache=None to always render.
+def render_dot(dot, format="png", cache=RENDER_CACHE):
+    key = None
+    if cache is not None:
+        key = cache.key(dot, format)
+        data = cache.get(key)
+        if data is not None:
+            return data
+    from graphviz import Source
+    data = Source(dot, format=format).pipe(format=format)
+    if cache is not None:
+        cache.put(key, data)
+    return data
+
+
+# Renders many graphs (TreeViews or DOT strings) in one call and returns their
+# images in the same order. Each distinct graph is rendered once, with up to
+# workers dot processes running side by side.
+def render_many(graphs, format="png", workers=None, cache=RENDER_CACHE):
+    sources = [graph if isinstance(graph, str) else graph.dot() for graph in graphs]
+    unique = list(dict.fromkeys(sources))
+    if len(unique) < 2 or workers == 1:
+        images = [render_dot(dot, format, cache) for dot in unique]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            images = list(pool.map(lambda dot: render_dot(dot, format, cache), unique))
+    rendered = dict(zip(unique, images))
+    return [rendered[dot] for dot in sources]
+
+
+class TreeView:
+    def __init__(self, root, children, label, max_depth=6, max_nodes=300, stats=None):
+        self.root = root
+        self.children = children
+        self.label = label
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.stats = stats
+        self.expanded = set()
+        # Paths of the nodes drawn collapsed or with a "more" node by the last dot()
+        self.collapsed = []
+
+    def expand(self, path):
+        self.expanded.add(path)
+
+    def collapse(self, path):
+        self.expanded.discard(path)
+
+    def expand_collapsed(self):
+        # Opens one more level everywhere the last view was cut short
+        self.expanded.update(self.collapsed)
+
+    def count(self, node):
+        # Number of descendants of node
+        total = 0
+        stack = list(self.children(node))
+        while stack:
+            child = stack.pop()
+            total += 1
+            stack.extend(self.children(child))
+        return total
+
+    def dot(self):
+        if self.stats is not None:
+            with self.stats.stage("visualize.dot"):
+                return self._dot()
+        return self._dot()
+
+    def _dot(self):
+        lines = ["digraph {", "  node [shape=box, fontsize=10];"]
+        collapsed = []
+        hidden = {}
+        drawn = 0
+        # (node, path, parent path, depth, forced by an expanded parent)
+        queue = deque([(self.root, "0", None, 0, True)])
+        while queue:
+            node, path, parent, depth, forced = queue.popleft()
+            if not forced and drawn >= self.max_nodes:
+                hidden[parent] = hidden.get(parent, 0) + 1
+                continue
+            drawn += 1
+            node_id = "n" + path.replace(".", "_")
+            children = self.children(node)
+            if children and path not in self.expanded and depth >= self.max_depth:
+                label = f"{self.label(node)} (+{self.count(node)})"
+                lines.append(f"  {node_id} [label={_quote(label, 60)}, style=dashed];")
+                collapsed.append(path)
+            else:
+                lines.append(f"  {node_id} [label={_quote(self.label(node))}];")
+                open_all = path in self.expanded
+                for i, child in enumerate(children):
+                    queue.append((child, f"{path}.{i}", path, 0 if open_all else depth + 1, open_all))
+            if parent is not None:
+                lines.append(f"  n{parent.replace('.', '_')} -> {node_id};")
+        for parent, count in hidden.items():
+            node_id = "n" + parent.replace(".", "_") + "_more"
+            lines.append(f"  {node_id} [label={_quote(f'… {count} more')}, style=dotted];")
+            lines.append(f"  n{parent.replace('.', '_')} -> {node_id};")
+            collapsed.append(parent)
+        lines.append("}")
+        self.collapsed = collapsed
+        return "\n".join(lines) + "\n"
+
+    @property
+    def source(self):
+        return self.dot()
+
+    def pipe(self, format="svg", cache=RENDER_CACHE):
+        # Rendered image as bytes (see render_dot)
+        dot = self.dot()
+        if self.stats is not None:
+            with self.stats.stage("visualize.render"):
+                return render_dot(dot, format, cache)
+        return render_dot(dot, format, cache)